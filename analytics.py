@@ -0,0 +1,168 @@
+from array import array
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import func
+from models import db, Plan, Subscription, Payment, PaymentSummary
+
+def month_index(year, month):
+    return int(year) * 12 + int(month) - 1
+
+def month_label(index):
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+class LifetimeTable:
+    """Subscription counts per (plan, start month, churn month) held in parallel typed arrays
+
+    end is -1 for subscriptions that have not churned. The table has one
+    entry per distinct combination rather than per subscription, so even
+    very large tenants reduce to a few thousand entries.
+    """
+
+    def __init__(self):
+        self.plan = array('q')
+        self.start = array('l')
+        self.end = array('l')
+        self.count = array('q')
+
+    def __len__(self):
+        return len(self.count)
+
+def load_lifetimes(business_id, since=None):
+    """Count a business's subscriptions per plan, start month and churn month
+
+    The database groups by the raw (start_date, cancellation_date, plan_id)
+    columns in the order of ix_subscriptions_business_id_lifetime, so the
+    scan reads only the index; the far smaller result is folded into months
+    here. A cancellation dated before the start counts in the start month.
+    """
+    columns = [Subscription.start_date, Subscription.cancellation_date, Subscription.plan_id]
+    query = db.session.query(*columns, func.count(Subscription.subscription_id)).filter(
+        Subscription.business_id == business_id
+    )
+    if since:
+        query = query.filter(Subscription.start_date >= since)
+
+    counts = {}
+    for start_date, cancellation_date, plan_id, count in query.group_by(*columns):
+        start = month_index(start_date.year, start_date.month)
+        if cancellation_date is None:
+            end = -1
+        else:
+            end = max(month_index(cancellation_date.year, cancellation_date.month), start)
+        key = (plan_id, start, end)
+        counts[key] = counts.get(key, 0) + count
+
+    table = LifetimeTable()
+    for (plan_id, start, end), count in counts.items():
+        table.plan.append(plan_id)
+        table.start.append(start)
+        table.end.append(end)
+        table.count.append(count)
+    return table
+
+def cohort_retention(business_id, today=None, since=None):
+    """Retention by start month cohort against months survived
+
+    retained[k] is the number of the cohort's subscriptions still active at
+    the end of the k-th month after the cohort month (k = 0 is the cohort
+    month itself), up to the current month.
+    """
+    today = today or date.today()
+    current = month_index(today.year, today.month)
+    table = load_lifetimes(business_id, since)
+    if not len(table):
+        return []
+
+    first = min(table.start)
+    width = max(current - first + 1, 0)
+    sizes = array('q', bytes(8 * width))
+    churned = array('q', bytes(8 * width * width))  # churned[cohort * width + months survived]
+    for start, end, count in zip(table.start, table.end, table.count):
+        if start > current:
+            continue  # starts in the future
+        cohort = start - first
+        sizes[cohort] += count
+        if end >= 0 and end <= current:
+            churned[cohort * width + max(end - start, 0)] += count
+
+    cohorts = []
+    for cohort in range(width):
+        size = sizes[cohort]
+        if not size:
+            continue
+        remaining = size
+        retained = []
+        for offset in range(width - cohort):
+            remaining -= churned[cohort * width + offset]
+            retained.append(remaining)
+        cohorts.append({
+            'cohort': month_label(first + cohort),
+            'size': size,
+            'retained': retained,
+            'retention': [round(count / size, 4) for count in retained]
+        })
+    return cohorts
+
+def plan_ltv(business_id, today=None, since=None):
+    """Lifetime, churn and lifetime value per plan
+
+    monthly_churn_rate is churned subscriptions over subscriber-months of
+    exposure, and projected_ltv is the plan's monthly price divided by it.
+    revenue_per_subscription is what has actually been collected so far.
+    """
+    today = today or date.today()
+    current = month_index(today.year, today.month)
+    table = load_lifetimes(business_id, since)
+
+    # plan_id -> [subscriptions, churned, subscriber-months]
+    totals = {}
+    for plan_id, start, end, count in zip(table.plan, table.start, table.end, table.count):
+        if start > current:
+            continue
+        entry = totals.setdefault(plan_id, [0, 0, 0])
+        entry[0] += count
+        if end >= 0 and end <= current:
+            entry[1] += count
+            entry[2] += count * (max(end - start, 0) + 1)
+        else:
+            entry[2] += count * (current - start + 1)
+
+    # Hot payments plus the monthly summaries of archived ones
+    revenue = {}
+    for amount_column, business_column, subscription_column, *conditions in (
+        (Payment.amount, Payment.business_id, Payment.subscription_id, Payment.status == 'paid'),
+        (PaymentSummary.paid_amount, PaymentSummary.business_id, PaymentSummary.subscription_id)
+    ):
+        revenue_query = db.session.query(Subscription.plan_id, func.sum(amount_column)).join(
+            Subscription, subscription_column == Subscription.subscription_id
+        ).filter(business_column == business_id, *conditions)
+        if since:
+            revenue_query = revenue_query.filter(Subscription.start_date >= since)
+        for plan_id, amount in revenue_query.group_by(Subscription.plan_id):
+            revenue[plan_id] = revenue.get(plan_id, Decimal('0')) + Decimal(amount or 0)
+
+    report = []
+    for plan in Plan.query.filter_by(business_id=business_id).order_by(Plan.plan_id):
+        subscriptions, churned, exposure = totals.get(plan.plan_id, (0, 0, 0))
+        monthly_price = plan.price if plan.billing_interval == 'monthly' else plan.price / 12
+        churn_rate = churned / exposure if exposure else None
+        collected = revenue.get(plan.plan_id, Decimal('0'))
+        report.append({
+            'plan_id': plan.plan_id,
+            'name': plan.name,
+            'billing_interval': plan.billing_interval,
+            'monthly_price': float(round(monthly_price, 2)),
+            'subscriptions': subscriptions,
+            'churned': churned,
+            'average_lifetime_months': round(exposure / subscriptions, 2) if subscriptions else None,
+            'monthly_churn_rate': round(churn_rate, 4) if churn_rate is not None else None,
+            'projected_ltv': float(round(monthly_price / Decimal(churn_rate), 2)) if churn_rate else None,
+            'revenue_collected': float(collected),
+            'revenue_per_subscription': float(round(collected / subscriptions, 2)) if subscriptions else None
+        })
+    return report
+
+REPORTS = {
+    'cohorts': cohort_retention,
+    'ltv': plan_ltv,
+}
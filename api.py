@@ -0,0 +1,71 @@
+from flask import Blueprint
+from flask_login import login_required
+from routes import (api_metrics_route, api_metrics_timeseries_route, api_analytics_route, api_import_route,
+                    api_export_route, api_cache_stats_route, api_customers_route, api_subscriptions_route,
+                    api_bulk_subscriptions_route, billing_job_status_route)
+from versions import conditional
+from routing import read_only
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+@api.route('/metrics')
+@read_only
+@login_required
+@conditional
+def api_metrics():
+    return api_metrics_route()
+
+@api.route('/metrics/timeseries')
+@read_only
+@login_required
+@conditional
+def api_metrics_timeseries():
+    return api_metrics_timeseries_route()
+
+@api.route('/analytics/<report>')
+@read_only
+@login_required
+@conditional
+def api_analytics(report):
+    return api_analytics_route(report)
+
+@api.route('/import/<kind>', methods=['POST'])
+@login_required
+def api_import(kind):
+    return api_import_route(kind)
+
+@api.route('/export/<kind>')
+@read_only
+@login_required
+@conditional
+def api_export(kind):
+    return api_export_route(kind)
+
+@api.route('/cache/stats')
+@login_required
+def api_cache_stats():
+    return api_cache_stats_route()
+
+@api.route('/customers')
+@read_only
+@login_required
+@conditional
+def api_customers():
+    return api_customers_route()
+
+@api.route('/subscriptions')
+@read_only
+@login_required
+@conditional
+def api_subscriptions():
+    return api_subscriptions_route()
+
+@api.route('/subscriptions/bulk/<operation>', methods=['POST'])
+@login_required
+def api_bulk_subscriptions(operation):
+    return api_bulk_subscriptions_route(operation)
+
+@api.route('/billing/jobs/<int:job_id>')
+@login_required
+def billing_job_status(job_id):
+    return billing_job_status_route(job_id)
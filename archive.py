@@ -0,0 +1,127 @@
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import func, literal
+from sqlalchemy.exc import IntegrityError
+from models import db, Payment, PaymentArchive, PaymentSummary
+
+DEFAULT_HOT_MONTHS = 12
+PAYMENT_COLUMNS = ['payment_id', 'business_id', 'subscription_id', 'amount', 'payment_date', 'status']
+
+def month_start(day, months_back=0):
+    """First day of the month months_back months before day's month"""
+    index = day.year * 12 + day.month - 1 - months_back
+    return date(index // 12, index % 12 + 1, 1)
+
+def next_month(month):
+    return month_start(month, -1)
+
+def archive_horizon(hot_months, today=None):
+    """Payments dated before this day are archived: the current month plus hot_months - 1 before it stay hot"""
+    return month_start(today or date.today(), max(hot_months - 1, 0))
+
+def months_to_archive(horizon, business_id=None):
+    """(business_id, month) pairs with hot payments before horizon, oldest month first per business"""
+    oldest = db.session.query(Payment.business_id, func.min(Payment.payment_date)).filter(
+        Payment.payment_date < datetime.combine(horizon, datetime.min.time())
+    )
+    if business_id is not None:
+        oldest = oldest.filter(Payment.business_id == business_id)
+    for row_business_id, first_payment in oldest.group_by(Payment.business_id).order_by(Payment.business_id).all():
+        if isinstance(first_payment, str):  # SQLite returns aggregates of DateTime columns as text
+            first_payment = datetime.fromisoformat(first_payment)
+        month = month_start(first_payment)
+        while month < horizon:
+            yield row_business_id, month
+            month = next_month(month)
+
+def month_conditions(model, business_id, month):
+    return [
+        model.business_id == business_id,
+        model.payment_date >= datetime.combine(month, datetime.min.time()),
+        model.payment_date < datetime.combine(next_month(month), datetime.min.time())
+    ]
+
+def archive_month(business_id, month):
+    """Move one business's payments for one month to the archive and rebuild that month's summaries
+
+    One transaction, committed here: the copy, the summaries and the delete
+    from payments land together, so readers that add hot and cold storage
+    never count a payment twice or miss it. Summaries are rebuilt from the
+    whole archived month, so a month archived again (e.g. after a late
+    import) stays correct. Returns the number of payments moved.
+    """
+    hot = month_conditions(Payment, business_id, month)
+    moved = db.session.execute(
+        db.insert(PaymentArchive).from_select(
+            PAYMENT_COLUMNS, db.select(*[getattr(Payment, column) for column in PAYMENT_COLUMNS]).where(*hot)
+        )
+    ).rowcount
+    if not moved:
+        db.session.rollback()
+        return 0
+
+    is_paid = PaymentArchive.status == 'paid'
+    db.session.execute(db.delete(PaymentSummary).where(
+        PaymentSummary.business_id == business_id, PaymentSummary.month == month
+    ))
+    db.session.execute(
+        db.insert(PaymentSummary).from_select(
+            ['subscription_id', 'month', 'business_id', 'paid_count', 'paid_amount', 'failed_count'],
+            db.select(
+                PaymentArchive.subscription_id,
+                literal(month, db.Date),
+                literal(business_id),
+                func.count(PaymentArchive.payment_id).filter(is_paid),
+                func.coalesce(func.sum(PaymentArchive.amount).filter(is_paid), 0),
+                func.count(PaymentArchive.payment_id).filter(PaymentArchive.status == 'failed')
+            ).where(*month_conditions(PaymentArchive, business_id, month)).group_by(PaymentArchive.subscription_id)
+        )
+    )
+    db.session.execute(db.delete(Payment).where(*hot).execution_options(synchronize_session=False))
+    db.session.commit()
+    return moved
+
+def archive_payments(hot_months=None, business_id=None, dry_run=False, today=None):
+    """Archive every payment older than the hot horizon, a business and month at a time
+
+    hot_months defaults to the PAYMENT_HOT_MONTHS setting. Returns
+    {'horizon', 'months', 'payments'}; with dry_run nothing is moved and
+    payments counts what would be.
+    """
+    if hot_months is None:
+        hot_months = int(current_app.config.get('PAYMENT_HOT_MONTHS', DEFAULT_HOT_MONTHS))
+    if hot_months < 1:
+        raise ValueError('hot_months must be at least 1')
+    horizon = archive_horizon(hot_months, today)
+    report = {'horizon': horizon, 'months': 0, 'payments': 0}
+
+    if dry_run:
+        query = db.session.query(func.count(Payment.payment_id)).filter(
+            Payment.payment_date < datetime.combine(horizon, datetime.min.time()))
+        if business_id is not None:
+            query = query.filter(Payment.business_id == business_id)
+        report['payments'] = query.scalar()
+        return report
+
+    for row_business_id, month in list(months_to_archive(horizon, business_id)):
+        try:
+            moved = archive_month(row_business_id, month)
+        except IntegrityError:
+            # Another process archived the same month first
+            db.session.rollback()
+            continue
+        if moved:
+            report['months'] += 1
+            report['payments'] += moved
+    return report
+
+def archive_if_due(today=None):
+    """Archive payments that crossed the horizon, at most once a day per process; PAYMENT_HOT_MONTHS=0 disables"""
+    today = today or date.today()
+    hot_months = int(current_app.config.get('PAYMENT_HOT_MONTHS', DEFAULT_HOT_MONTHS))
+    if hot_months < 1 or archive_if_due.last_day == today:
+        return 0
+    archive_if_due.last_day = today
+    return archive_payments(hot_months, today=today)['payments']
+
+archive_if_due.last_day = None
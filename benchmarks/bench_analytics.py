@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark for cohort retention and plan LTV reports
+Seeds a throwaway SQLite database at increasing subscription counts and
+times the grouped analytics path against a per-row loop over Subscription
+objects (skipped above LEGACY_MAX_SCALE, where it takes minutes)
+"""
+
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Subscription
+from analytics import cohort_retention, plan_ltv, month_index
+from bench_metrics import make_app, seed
+
+SCALES = [100000, 1000000]
+LEGACY_MAX_SCALE = 100000
+
+def legacy_cohorts(business_id):
+    """Cohort retention computed per subscription in Python"""
+    today = date.today()
+    current = month_index(today.year, today.month)
+    cohorts = defaultdict(lambda: defaultdict(int))
+    for sub in Subscription.query.filter_by(business_id=business_id).all():
+        start = month_index(sub.start_date.year, sub.start_date.month)
+        end = sub.cancellation_date
+        survived = (month_index(end.year, end.month) if end else current + 1) - start
+        for offset in range(current - start + 1):
+            if offset < survived:
+                cohorts[start][offset] += 1
+    return cohorts
+
+def time_ms(fn, business_id):
+    started = time.perf_counter()
+    fn(business_id)
+    elapsed = (time.perf_counter() - started) * 1000
+    db.session.expunge_all()
+    return elapsed
+
+def run():
+    print(f"{'subscriptions':>14} {'cohorts ms':>12} {'ltv ms':>10} {'legacy ms':>12}")
+    for count in SCALES:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(os.path.join(tmp, 'bench.db'))
+            with app.app_context():
+                db.create_all()
+                business_id = seed(count)
+
+                cohorts = time_ms(cohort_retention, business_id)
+                ltv = time_ms(plan_ltv, business_id)
+                legacy = time_ms(legacy_cohorts, business_id) if count <= LEGACY_MAX_SCALE else None
+                db.session.remove()
+
+        legacy_text = f"{legacy:>12.0f}" if legacy is not None else f"{'-':>12}"
+        print(f"{count:>14} {cohorts:>12.0f} {ltv:>10.0f} {legacy_text}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the chunked billing engine
+Seeds a throwaway SQLite database where every active subscription is due
+and reports billing throughput and peak traced memory at increasing scales.
+tracemalloc slows Python-side work, so absolute rows/sec are pessimistic.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db
+from billing import run_billing
+from bench_metrics import make_app, seed
+
+SCALES = [10000, 100000, 250000]
+
+def run():
+    print(f"{'subscriptions':>14} {'billed':>10} {'seconds':>10} {'rows/sec':>12} {'peak MB':>10}")
+    for count in SCALES:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(os.path.join(tmp, 'bench.db'))
+            with app.app_context():
+                db.create_all()
+                business_id = seed(count)
+
+                # Bill as of a month from now so every active subscription is due
+                tracemalloc.start()
+                started = time.perf_counter()
+                billed = run_billing(business_id, today=date.today() + timedelta(days=31))
+                elapsed = time.perf_counter() - started
+                peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                tracemalloc.stop()
+                db.session.remove()
+
+        print(f"{count:>14} {billed:>10} {elapsed:>10.2f} {billed / elapsed:>12.0f} {peak_mb:>10.1f}")
+
+if __name__ == "__main__":
+    run()
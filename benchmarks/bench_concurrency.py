@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark: dashboard reads while billing writes
+Forks READERS processes that repeatedly read dashboard metrics and load a
+subscriptions page, alongside one process running billing cycles, and
+reports read throughput, read latency, billing throughput and errors.
+Runs SQLite with its default journal and with the configured pragmas, and
+PostgreSQL when BENCH_POSTGRES_URL points at a disposable database.
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from config import Config
+from database import init_database
+from models import db, Subscription
+from metrics import get_business_metrics
+from billing import run_billing
+from listing import list_subscriptions
+from bench_metrics import seed
+
+SUBSCRIPTIONS = 50000
+TENANTS = 4
+READERS = 4
+DURATION = 10  # seconds
+
+def make_app(uri, pragmas):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLITE_PRAGMAS'] = pragmas
+    init_database(app)
+    return app
+
+def reader(app, business_ids, worker, results):
+    latencies = []
+    errors = 0
+    with app.app_context():
+        db.engine.dispose(close=False)
+        deadline = time.perf_counter() + DURATION
+        while time.perf_counter() < deadline:
+            business_id = business_ids[(worker + len(latencies)) % len(business_ids)]
+            started = time.perf_counter()
+            try:
+                get_business_metrics(business_id)
+                list_subscriptions(Subscription.query.filter_by(business_id=business_id), business_id)
+                latencies.append(time.perf_counter() - started)
+            except OperationalError:
+                errors += 1
+            db.session.rollback()
+    results.put(('read', latencies, errors))
+
+def writer(app, business_ids, results):
+    billed = 0
+    errors = 0
+    with app.app_context():
+        db.engine.dispose(close=False)
+        started = time.perf_counter()
+        deadline = started + DURATION
+        cycle = 1
+        while time.perf_counter() < deadline:
+            # Bill further ahead each cycle so every active subscription is due again
+            today = date.today() + timedelta(days=31 * cycle)
+            for business_id in business_ids:
+                try:
+                    billed += run_billing(business_id, today=today)
+                except OperationalError:
+                    errors += 1
+                    db.session.rollback()
+                if time.perf_counter() >= deadline:
+                    break
+            cycle += 1
+        # A run can overshoot the deadline, so rate against the time actually spent
+        elapsed = time.perf_counter() - started
+    results.put(('write', billed / elapsed, errors))
+
+def run_backend(label, uri, pragmas):
+    app = make_app(uri, pragmas)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        business_ids = [seed(SUBSCRIPTIONS // TENANTS, f'tenant{i}') for i in range(TENANTS)]
+        for business_id in business_ids:
+            get_business_metrics(business_id)  # build the rollup rows up front
+        db.session.remove()
+        db.engine.dispose()
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=reader, args=(app, business_ids, i, results)) for i in range(READERS)]
+    processes.append(context.Process(target=writer, args=(app, business_ids, results)))
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(l for kind, values, _ in outcomes if kind == 'read' for l in values)
+    read_errors = sum(errors for kind, _, errors in outcomes if kind == 'read')
+    billed_rate, write_errors = next((values, errors) for kind, values, errors in outcomes if kind == 'write')
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+    print(f"{label:<16} {len(latencies) / DURATION:>10.0f} {p50:>8.1f} {p95:>8.1f} "
+          f"{billed_rate:>12.0f} {read_errors + write_errors:>8}")
+
+    if not uri.startswith('sqlite'):
+        with app.app_context():
+            db.drop_all()
+
+def run():
+    print(f"{'backend':<16} {'reads/sec':>10} {'p50 ms':>8} {'p95 ms':>8} {'billed/sec':>12} {'errors':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        run_backend('sqlite default', f"sqlite:///{os.path.join(tmp, 'default.db')}", {})
+        run_backend('sqlite tuned', f"sqlite:///{os.path.join(tmp, 'tuned.db')}", Config.SQLITE_PRAGMAS)
+    postgres_url = os.getenv('BENCH_POSTGRES_URL')
+    if postgres_url:
+        run_backend('postgresql', postgres_url, {})
+    else:
+        print("Set BENCH_POSTGRES_URL to a disposable database to include PostgreSQL")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark for dashboard metrics aggregation
+Seeds a throwaway SQLite database at increasing subscription counts and
+times compute_business_metrics against the previous per-row ORM loop
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, Business, Plan, Customer, Subscription
+from metrics import compute_business_metrics
+
+SCALES = [1000, 10000, 100000]
+REPEAT = 20
+LEGACY_REPEAT = 3
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def seed(count, label='bench'):
+    business = Business(business_name=f'{label.title()} Co', owner_email=f'{label}@example.com', password_hash='x')
+    db.session.add(business)
+    db.session.flush()
+
+    monthly = Plan(business_id=business.business_id, name='Basic', price=Decimal('29.00'), billing_interval='monthly')
+    yearly = Plan(business_id=business.business_id, name='Pro', price=Decimal('990.00'), billing_interval='yearly')
+    db.session.add_all([monthly, yearly])
+    db.session.flush()
+
+    customer_count = max(count // 2, 1)
+    db.session.execute(db.insert(Customer), [
+        {'business_id': business.business_id, 'full_name': f'Customer {i}', 'email': f'c{i}@example.com'}
+        for i in range(customer_count)
+    ])
+    first_customer = db.session.query(db.func.min(Customer.customer_id)).filter(
+        Customer.business_id == business.business_id).scalar()
+
+    today = date.today()
+    db.session.execute(db.insert(Subscription), [
+        {
+            'business_id': business.business_id,
+            'customer_id': first_customer + (i % customer_count),
+            'plan_id': monthly.plan_id if i % 4 else yearly.plan_id,
+            'status': 'canceled' if i % 10 == 0 else 'active',
+            'start_date': today - timedelta(days=i % 700),
+            'next_billing_date': today + timedelta(days=i % 30),
+            'cancellation_date': today - timedelta(days=i % 60) if i % 10 == 0 else None
+        }
+        for i in range(count)
+    ])
+    db.session.commit()
+    return business.business_id
+
+def legacy_metrics(business_id):
+    """The per-row computation the routes used before the shared aggregate"""
+    Subscription.query.join(Customer).filter(
+        Customer.business_id == business_id,
+        Subscription.status == 'active'
+    ).count()
+    active_subs = Subscription.query.join(Customer).join(Plan).filter(
+        Customer.business_id == business_id,
+        Subscription.status == 'active'
+    ).all()
+    mrr = Decimal('0.0')
+    for sub in active_subs:
+        if sub.plan.billing_interval == 'monthly':
+            mrr += sub.plan.price
+        else:
+            mrr += sub.plan.price / 12
+    current_month = date.today().replace(day=1)
+    Subscription.query.join(Customer).filter(
+        Customer.business_id == business_id,
+        Subscription.cancellation_date >= current_month
+    ).count()
+    Subscription.query.join(Customer).filter(Customer.business_id == business_id).count()
+    return mrr
+
+def time_ms(fn, business_id, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(business_id)
+        timings.append((time.perf_counter() - started) * 1000)
+        db.session.expunge_all()
+    return sum(timings) / len(timings)
+
+def run():
+    print(f"{'subscriptions':>14} {'aggregate ms':>14} {'legacy ms':>12}")
+    for count in SCALES:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(os.path.join(tmp, 'bench.db'))
+            with app.app_context():
+                db.create_all()
+                business_id = seed(count)
+
+                aggregate = time_ms(compute_business_metrics, business_id, REPEAT)
+                legacy = time_ms(legacy_metrics, business_id, LEGACY_REPEAT)
+                db.session.remove()
+
+        print(f"{count:>14} {aggregate:>14.2f} {legacy:>12.2f}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the cached session principal
+Times authenticated /api/v1/metrics requests, plain and as If-None-Match
+revalidations, with the principal cache off (a businesses lookup on every
+request) and on, and reports SQL statements and median time per request.
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from config import config, ProductionConfig
+from app import create_app
+from migrations import upgrade_database
+from models import db
+from bench_metrics import seed
+
+REPEAT = 500
+PATH = '/api/v1/metrics'
+
+def make_app(path, ttl):
+    class BenchmarkConfig(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        PRINCIPAL_CACHE_TTL = ttl
+        INSTRUMENTATION = False
+
+    config['benchmark'] = BenchmarkConfig
+    return create_app('benchmark')
+
+def measure(client, engine, headers):
+    statements = []
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    for _ in range(10):
+        client.get(PATH, headers=headers)
+    timings = []
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        client.get(PATH, headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+    event.remove(engine, 'before_cursor_execute', count_statement)
+    return len(statements) / REPEAT, statistics.median(timings)
+
+def run():
+    print(f"{'principal cache':<16} {'request':<14} {'SQL/request':>12} {'median ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        for ttl in (0, 60):
+            app = make_app(path, ttl)
+            with app.app_context():
+                if ttl == 0:
+                    upgrade_database()
+                    business_id = seed(1000)
+                engine = db.engine
+
+            # Outside the app context above, so every request gets a fresh session as in production
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['_user_id'] = str(business_id)
+            etag = client.get(PATH).headers['ETag']
+            for label, headers in (('plain', {}), ('revalidation', {'If-None-Match': etag})):
+                per_request, median = measure(client, engine, headers)
+                print(f"{'on' if ttl else 'off':<16} {label:<14} {per_request:>12.1f} {median:>10.3f}")
+            engine.dispose()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Read replica routing check
+Fills a primary SQLite database with datagen.py and copies it to one or
+two stand-in replica files, then requests every read_only page and API
+endpoint and reports how many statements each database ran. It also
+checks that a write is followed by reads on the primary (read your
+writes), and that an unreachable replica falls back to the others and
+finally to the primary. Point --replica at a PostgreSQL replica instead
+to check a real one (the primary must then be its source):
+
+    python benchmarks/bench_replicas.py --subscriptions 10000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from config import config, ProductionConfig
+from app import create_app
+from migrations import upgrade_database
+from models import db
+from metrics import rebuild_business_metrics
+from datagen import generate
+
+PATHS = [
+    '/dashboard', '/plans', '/customers', '/subscriptions', '/api/v1/metrics', '/api/v1/metrics/timeseries',
+    '/api/v1/analytics/ltv', '/api/v1/customers', '/api/v1/subscriptions', '/api/v1/export/payments'
+]
+
+def make_app(primary, replicas):
+    class BenchmarkConfig(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = primary
+        SQLALCHEMY_REPLICA_URIS = replicas
+        METRICS_CACHE = 'none'
+        INSTRUMENTATION = False
+
+    config['benchmark'] = BenchmarkConfig
+    return create_app('benchmark')
+
+def copy_sqlite(source, target):
+    """Stand-in replication: a consistent copy of the primary file"""
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+def count_statements(engines):
+    counts = {engine: 0 for engine in engines}
+    for engine in engines:
+        def count(*args, engine=engine):
+            counts[engine] += 1
+        event.listen(engine, 'before_cursor_execute', count)
+    return counts
+
+def log_in(client, business_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(business_id)
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subscriptions', type=int, default=10000)
+    parser.add_argument('--replica', action='append', help='Replica URL (default: SQLite copies of the primary).')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        primary_path = os.path.join(tmp, 'primary.db')
+        primary = f'sqlite:///{primary_path}'
+        with make_app(primary, []).app_context():
+            upgrade_database()
+            business_id = generate(args.subscriptions, seed=0)['businesses'][0][0]
+            rebuild_business_metrics(business_id)
+            db.session.commit()
+            db.engine.dispose()
+
+        replicas = args.replica
+        if not replicas:
+            replicas = []
+            for name in ('replica1.db', 'replica2.db'):
+                copy_sqlite(primary_path, os.path.join(tmp, name))
+                replicas.append(f'sqlite:///{os.path.join(tmp, name)}')
+
+        app = make_app(primary, replicas)
+        with app.app_context():
+            primary_engine = db.engine
+        replica_engines = app.extensions['replicas'].engines
+        counts = count_statements([primary_engine] + replica_engines)
+        client = app.test_client()
+        log_in(client, business_id)
+
+        print(f"{'path':<32} {'ms':>8} {'primary':>8} " + ' '.join(f'{f"replica{i + 1}":>9}' for i in range(len(replicas))))
+        for path in PATHS:
+            before = dict(counts)
+            started = time.perf_counter()
+            response = client.get(path)
+            elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(f'GET {path} returned {response.status_code}')
+            used = [counts[engine] - before[engine] for engine in [primary_engine] + replica_engines]
+            print(f"{path:<32} {elapsed:>8.2f} {used[0]:>8} " + ' '.join(f'{count:>9}' for count in used[1:]))
+
+        # Read your writes: a plan created on the primary shows up on the next page view
+        before = counts[primary_engine]
+        client.post('/plans/new', data={'name': 'Replica check', 'price': '12.00', 'billing_interval': 'monthly'})
+        listed = 'Replica check' in client.get('/plans').get_data(as_text=True)
+        print(f"\nAfter a write the plans page {'shows' if listed else 'MISSES'} the new plan "
+              f"({counts[primary_engine] - before} statements on the primary)")
+
+        # Health fallback: replicas that cannot be opened are skipped
+        unreachable = [f'sqlite:///{os.path.join(tmp, "missing", "replica.db")}'] * 2
+        for label, urls in (('one replica down', unreachable[:1] + replicas[:1]), ('all replicas down', unreachable)):
+            app = make_app(primary, urls)
+            client = app.test_client()
+            log_in(client, business_id)
+            status = client.get('/api/v1/metrics').status_code
+            print(f"{label}: /api/v1/metrics returned {status}")
+
+if __name__ == "__main__":
+    run()
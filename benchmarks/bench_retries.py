@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Retry storm benchmark for the billing worker
+Fills a throwaway SQLite database with datagen.py, queues a billing job for
+every business as of next month (so every monthly subscription is due) and
+drains the queue with the real worker loop through the simulated gateway,
+once on its own and once with a storm of due payment retries waiting.
+Reports when the last billing job finished, how many retries ran and
+whether the metrics rollups still match the live tables:
+
+    python benchmarks/bench_retries.py --subscriptions 100000 --storm 0.2 --failure-rate 0.3
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+from config import config, ProductionConfig
+from app import create_app
+from migrations import upgrade_database
+from models import db, Subscription, Payment, BillingJob
+from metrics import rebuild_business_metrics, reconcile_business_metrics
+from jobs import enqueue_due_businesses, run_worker
+from datagen import generate
+
+def make_app(path, failure_rate):
+    class BenchmarkConfig(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        PAYMENT_FAILURE_RATE = failure_rate
+        PAYMENT_HOT_MONTHS = 0
+        INSTRUMENTATION = False
+
+    config['benchmark'] = BenchmarkConfig
+    return create_app('benchmark')
+
+def start_storm(fraction):
+    """Put about a fraction of the active subscriptions (every n-th one) into past_due with a retry due now"""
+    every = max(round(1 / fraction), 1)
+    storm = db.session.execute(
+        db.update(Subscription).where(Subscription.status == 'active', Subscription.subscription_id % every == 0)
+        .values(status='past_due', retry_count=0, next_retry_at=datetime.utcnow() - timedelta(hours=1))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return storm
+
+def run_scenario(subscriptions, storm_fraction, failure_rate, seed):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'), failure_rate)
+        with app.app_context():
+            upgrade_database()
+            summary = generate(subscriptions, seed=seed)
+            storm = start_storm(storm_fraction) if storm_fraction else 0
+            for business_id, _ in summary['businesses']:
+                rebuild_business_metrics(business_id)
+            db.session.commit()
+
+            run_date = date.today() + timedelta(days=31)
+            jobs = enqueue_due_businesses(run_date)
+            for job in jobs:
+                job.run_date = run_date
+            db.session.commit()
+            payments_before = db.session.query(func.count(Payment.payment_id)).scalar()
+
+            started = datetime.utcnow()
+            clock = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                billed = run_worker(once=True)
+            elapsed = time.perf_counter() - clock
+
+            billing_done = db.session.query(func.max(BillingJob.finished_at)).scalar()
+            if isinstance(billing_done, str):
+                billing_done = datetime.fromisoformat(billing_done)
+            payments = db.session.query(func.count(Payment.payment_id)).scalar() - payments_before
+            past_due = db.session.query(func.count(Subscription.subscription_id)).filter(
+                Subscription.status == 'past_due').scalar()
+            drifted = sum(1 for business_id, _ in summary['businesses'] if reconcile_business_metrics(business_id))
+            db.engine.dispose()
+
+    return {
+        'jobs': len(jobs), 'billed': billed, 'storm': storm, 'retried': payments - billed,
+        'billing_done_s': (billing_done - started).total_seconds(), 'total_s': elapsed,
+        'past_due': past_due, 'drifted': drifted
+    }
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subscriptions', type=int, default=100000)
+    parser.add_argument('--storm', type=float, default=0.2, help='Fraction of active subscriptions with a retry due.')
+    parser.add_argument('--failure-rate', type=float, default=0.3, help='Fraction of charges the gateway declines.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<10} {'jobs':>5} {'billed':>8} {'retried':>8} {'billing done s':>15} {'total s':>8} "
+          f"{'past_due':>9} {'drift':>6}")
+    for label, storm in (('no storm', 0), ('storm', args.storm)):
+        result = run_scenario(args.subscriptions, storm, args.failure_rate, args.seed)
+        print(f"{label:<10} {result['jobs']:>5} {result['billed']:>8} {result['retried']:>8} "
+              f"{result['billing_done_s']:>15.2f} {result['total_s']:>8.2f} {result['past_due']:>9} "
+              f"{result['drifted']:>6}")
+
+if __name__ == "__main__":
+    run()
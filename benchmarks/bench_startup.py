@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: what every gunicorn worker boot pays
+Starts RUNS fresh interpreters against a prepared SQLite database and times
+importing app, create_app() and the first authenticated dashboard request.
+Pass --json PATH to append the medians, with the current commit, to a JSON
+lines file so startup time can be tracked over time.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RUNS = 10
+
+CHILD = '''
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+client = app.test_client()
+with client.session_transaction() as session:
+    session['_user_id'] = '1'
+status = client.get('/dashboard').status_code
+finished = time.perf_counter()
+assert status == 200, status
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (finished - created) * 1000}))
+'''
+
+def prepare_database(path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import create_app
+    from migrations import upgrade_database
+    from models import db
+    from bench_metrics import seed
+    with create_app().app_context():
+        upgrade_database()
+        seed(1000)
+        db.session.remove()
+
+def measure_once():
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=os.environ,
+                            capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings['process_ms'] = (time.perf_counter() - started) * 1000
+    return timings
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=RUNS)
+    parser.add_argument('--json', metavar='PATH', help='Append the results to this JSON lines file.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare_database(os.path.join(tmp, 'startup.db'))
+        runs = [measure_once() for _ in range(args.runs)]
+
+    medians = {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+    for key, value in medians.items():
+        print(f"{key:<18} {value:>8.1f}")
+
+    if args.json:
+        record = dict(medians, runs=args.runs, commit=current_commit(),
+                      python=sys.version.split()[0], recorded_at=datetime.now().isoformat(timespec='seconds'))
+        with open(args.json, 'a') as results:
+            results.write(json.dumps(record) + '\n')
+        print(f"Appended to {args.json}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Hot path benchmark suite at 1k/100k/1M subscriptions
+For each scale, fills a throwaway SQLite database with datagen.py and times
+the dashboard, the metrics API, queuing a billing run, every list page (HTML
+and API, first page and a search) and a full billing cycle for the largest
+tenant, through the real app and its routes. The metrics cache is off so the
+rollup reads are measured, not cache hits.
+
+Write the results with --json PATH and compare a later run against them
+with --compare PATH; the comparison exits 1 when any median is more than
+--threshold percent slower, so it can gate a deploy:
+
+    python benchmarks/bench_suite.py --scales 1000 100000 --json baseline.json
+    python benchmarks/bench_suite.py --scales 1000 100000 --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event
+from config import config, ProductionConfig
+from app import create_app
+from migrations import upgrade_database
+from models import db
+from billing import run_billing
+from datagen import generate
+
+SCALES = [1000, 100000, 1000000]
+REPEAT = 20
+WARMUP = 3
+THRESHOLD = 25  # percent
+
+# (case, method, path); billing_route last since it leaves a flash message in the session
+CASES = [
+    ('dashboard', 'GET', '/dashboard'),
+    ('api_metrics', 'GET', '/api/v1/metrics'),
+    ('plans_page', 'GET', '/plans'),
+    ('customers_page', 'GET', '/customers'),
+    ('customers_page_search', 'GET', '/customers?q=pri&sort=name'),
+    ('subscriptions_page', 'GET', '/subscriptions'),
+    ('subscriptions_page_search', 'GET', '/subscriptions?q=nora&status=active'),
+    ('api_customers', 'GET', '/api/v1/customers?limit=50'),
+    ('api_subscriptions', 'GET', '/api/v1/subscriptions?limit=50&sort=start_date&order=desc'),
+    ('billing_route', 'GET', '/billing/run'),
+]
+
+def make_app(path):
+    class BenchmarkConfig(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        METRICS_CACHE = 'none'
+        INSTRUMENTATION = False
+
+    config['benchmark'] = BenchmarkConfig
+    return create_app('benchmark')
+
+def time_case(client, method, path, repeat, counter):
+    for _ in range(WARMUP):
+        client.open(path, method=method)
+    timings = []
+    counter['statements'] = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.open(path, method=method)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status_code}')
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(int(len(timings) * 0.95), len(timings) - 1)], 3),
+        'min_ms': round(timings[0], 3),
+        'statements': round(counter['statements'] / repeat, 1)
+    }
+
+def run_scale(scale, repeat, seed):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            upgrade_database()
+            started = time.perf_counter()
+            summary = generate(scale, seed=seed)
+            print(f"\n{scale} subscriptions: {len(summary['businesses'])} businesses, {summary['customers']} customers, "
+                  f"{summary['payments']} payments (generated in {time.perf_counter() - started:.1f}s)")
+            business_id, tenant_size = summary['businesses'][0]
+            engine = db.engine
+
+        counter = {'statements': 0}
+        def count_statement(*args):
+            counter['statements'] += 1
+        event.listen(engine, 'before_cursor_execute', count_statement)
+
+        # Requests run outside the setup app context so each gets its own session, as in production
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(business_id)
+        for case, method, path in CASES:
+            result = time_case(client, method, path, repeat, counter)
+            results.append(dict(result, scale=scale, case=case, tenant_subscriptions=tenant_size))
+            print(f"{case:<28} {result['median_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['statements']:>6}")
+        event.remove(engine, 'before_cursor_execute', count_statement)
+
+        with app.app_context():
+            # One full cycle as of next month, so every monthly subscription is due
+            started = time.perf_counter()
+            billed = run_billing(business_id, today=date.today() + timedelta(days=31))
+            elapsed = (time.perf_counter() - started) * 1000
+        results.append({'scale': scale, 'case': 'billing_cycle', 'tenant_subscriptions': tenant_size,
+                        'median_ms': round(elapsed, 3), 'billed': billed})
+        print(f"{'billing_cycle':<28} {elapsed:>10.2f} {'':>10} {'':>6}  ({billed} billed)")
+        engine.dispose()
+    return results
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, threshold):
+    """Print the change against a baseline run; return the cases that regressed beyond threshold percent"""
+    with open(baseline_path) as baseline_file:
+        baseline = {(row['scale'], row['case']): row for row in json.load(baseline_file)['results']}
+
+    print(f"\nAgainst {baseline_path}:")
+    print(f"{'scale':>8} {'case':<28} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    regressions = []
+    for row in results:
+        before = baseline.get((row['scale'], row['case']))
+        if before is None or not before['median_ms']:
+            continue
+        change = (row['median_ms'] - before['median_ms']) / before['median_ms'] * 100
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f"{row['scale']:>8} {row['case']:<28} {before['median_ms']:>10.2f} {row['median_ms']:>10.2f} "
+              f"{change:>+7.0f}%{flag}")
+        if flag:
+            regressions.append(row)
+    return regressions
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='PATH', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', metavar='PATH', help='Compare against results written by --json.')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='Percent slowdown of a median that counts as a regression.')
+    args = parser.parse_args()
+
+    print(f"{'case':<28} {'median ms':>10} {'p95 ms':>10} {'SQL':>6}")
+    results = []
+    for scale in args.scales:
+        results.extend(run_scale(scale, args.repeat, args.seed))
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({'commit': current_commit(), 'python': sys.version.split()[0], 'repeat': args.repeat,
+                       'seed': args.seed, 'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                       'results': results}, output, indent=2)
+        print(f"\nWrote {args.json}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) more than {args.threshold:g}% slower")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    run()
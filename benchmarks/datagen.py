@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Synthetic multi-tenant data generator
+Fills the models with a reproducible, roughly realistic data set: tenant
+sizes follow a Zipf distribution (a few large businesses, a long tail of
+small ones), each business has a mix of monthly and yearly plans, signups
+grow over three years of history, subscriptions churn at a per-plan rate,
+and the last PAYMENT_DAYS of billing history is recorded with a few failed
+payments. Importable by other benchmarks; run directly to fill a database:
+
+    python benchmarks/datagen.py /tmp/hub.db --subscriptions 100000
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash
+from models import db, Business, Plan, Customer, Subscription, Payment
+
+HISTORY_DAYS = 3 * 365
+PAYMENT_DAYS = 90  # billing history kept per subscription
+BATCH_SIZE = 10000
+PASSWORD = 'bench'  # every generated business logs in with owner<id>@example.com / bench
+ZIPF_EXPONENT = 1.1
+
+FIRST_NAMES = ['Alice', 'Bruno', 'Chen', 'Dana', 'Emeka', 'Fatima', 'Giulia', 'Hiro', 'Ines', 'Jonas',
+               'Kavya', 'Liam', 'Mateo', 'Nora', 'Olga', 'Priya', 'Quinn', 'Rosa', 'Sven', 'Tariq']
+LAST_NAMES = ['Anders', 'Brown', 'Costa', 'Dubois', 'Eze', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Jensen',
+              'Kim', 'Lopez', 'Muller', 'Novak', 'Okafor', 'Patel', 'Rossi', 'Silva', 'Tanaka', 'Weber']
+# (name, price, billing interval, monthly churn rate)
+PLAN_TEMPLATES = [
+    ('Starter', Decimal('9.00'), 'monthly', 0.06),
+    ('Basic', Decimal('29.00'), 'monthly', 0.04),
+    ('Pro', Decimal('79.00'), 'monthly', 0.03),
+    ('Team', Decimal('199.00'), 'monthly', 0.02),
+    ('Basic Annual', Decimal('290.00'), 'yearly', 0.015),
+    ('Pro Annual', Decimal('790.00'), 'yearly', 0.01),
+]
+
+def interval_days(billing_interval):
+    return 30 if billing_interval == 'monthly' else 365
+
+def tenant_sizes(subscriptions, businesses):
+    """Split subscriptions across businesses by a Zipf distribution, largest first, at least one each"""
+    weights = [1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(businesses)]
+    total = sum(weights)
+    sizes = [max(int(subscriptions * weight / total), 1) for weight in weights]
+    sizes[0] += subscriptions - sum(sizes)
+    return sizes
+
+def next_id(column):
+    return (db.session.query(db.func.max(column)).scalar() or 0) + 1
+
+def insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(db.insert(model), rows[start:start + BATCH_SIZE])
+
+def generate(subscriptions, businesses=None, seed=0, today=None, payment_days=PAYMENT_DAYS):
+    """Insert a data set of about `subscriptions` subscriptions into the current app's database
+
+    Returns {'businesses': [(business_id, subscription count), ...] largest
+    first, plus row counts per table}. The same arguments always produce the
+    same data.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    businesses = min(businesses or max(subscriptions // 2000, 1), subscriptions)
+    password_hash = generate_password_hash(PASSWORD)
+
+    business_id = next_id(Business.business_id)
+    plan_id = next_id(Plan.plan_id)
+    customer_id = next_id(Customer.customer_id)
+    subscription_id = next_id(Subscription.subscription_id)
+
+    tenants = []
+    totals = {'plans': 0, 'customers': 0, 'subscriptions': 0, 'payments': 0}
+    for size in tenant_sizes(subscriptions, businesses):
+        db.session.execute(db.insert(Business), [{
+            'business_id': business_id, 'business_name': f'Business {business_id}',
+            'owner_email': f'owner{business_id}@example.com', 'password_hash': password_hash,
+            'created_at': datetime.combine(today - timedelta(days=HISTORY_DAYS), datetime.min.time())
+        }])
+
+        # Two to six plans, always at least one monthly and one yearly
+        templates = [PLAN_TEMPLATES[1], PLAN_TEMPLATES[4]] + rng.sample(
+            [PLAN_TEMPLATES[i] for i in (0, 2, 3, 5)], rng.randint(0, 4))
+        plans = []
+        for name, price, billing_interval, churn in templates:
+            plans.append((plan_id, price, billing_interval, churn))
+            plan_id += 1
+        insert(Plan, [{'plan_id': pid, 'business_id': business_id, 'name': name, 'price': price,
+                       'billing_interval': billing_interval}
+                      for (pid, price, billing_interval, _), (name, *_) in zip(plans, templates)])
+        plan_weights = [3 if billing_interval == 'monthly' else 1 for _, _, billing_interval, _ in plans]
+
+        # Some customers hold several subscriptions, some none
+        customer_count = max(int(size / rng.uniform(1.05, 1.5)), 1)
+        first_customer = customer_id
+        customers = []
+        for _ in range(customer_count):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            customers.append({
+                'customer_id': customer_id, 'business_id': business_id, 'full_name': f'{first} {last}',
+                'email': f'{first.lower()}.{last.lower()}.{customer_id}@example.com',
+                'created_at': datetime.combine(today - timedelta(days=rng.randrange(HISTORY_DAYS)),
+                                               datetime.min.time())
+            })
+            customer_id += 1
+        insert(Customer, customers)
+
+        rows, payments = [], []
+        for _ in range(size):
+            pid, price, billing_interval, churn = rng.choices(plans, plan_weights)[0]
+            days = interval_days(billing_interval)
+            # Signups grow over time: more recent start dates are more likely
+            start_date = today - timedelta(days=int(HISTORY_DAYS * (1 - math.sqrt(rng.random()))))
+            churned_on = start_date + timedelta(days=int(rng.expovariate(churn / 30)))
+            cancellation_date = churned_on if churned_on <= today else None
+
+            if cancellation_date:
+                status = 'canceled'
+            elif (today - start_date).days < 14 and rng.random() < 0.3:
+                status = 'trial'
+            elif rng.random() < 0.02:
+                status = 'past_due'
+            else:
+                status = 'active'
+            periods = ((cancellation_date or today) - start_date).days // days + 1
+            next_billing_date = start_date + timedelta(days=periods * days)
+            if status == 'active' and rng.random() < 0.03:
+                next_billing_date -= timedelta(days=days)  # due now
+
+            rows.append({
+                'subscription_id': subscription_id, 'business_id': business_id,
+                'customer_id': first_customer + rng.randrange(customer_count), 'plan_id': pid, 'status': status,
+                'start_date': start_date, 'next_billing_date': next_billing_date,
+                'cancellation_date': cancellation_date
+            })
+            if status != 'trial':
+                for period in range(periods - 1, -1, -1):
+                    billed_on = start_date + timedelta(days=period * days)
+                    if (today - billed_on).days > payment_days:
+                        break
+                    payments.append({
+                        'business_id': business_id, 'subscription_id': subscription_id, 'amount': price,
+                        'payment_date': datetime.combine(billed_on, datetime.min.time()) + timedelta(hours=12),
+                        'status': 'failed' if rng.random() < 0.03 else 'paid'
+                    })
+            subscription_id += 1
+        insert(Subscription, rows)
+        insert(Payment, payments)
+        db.session.commit()
+
+        tenants.append((business_id, size))
+        totals['plans'] += len(plans)
+        totals['customers'] += customer_count
+        totals['subscriptions'] += size
+        totals['payments'] += len(payments)
+        business_id += 1
+
+    return dict(totals, businesses=tenants)
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('database', help='SQLite file to create or extend.')
+    parser.add_argument('--subscriptions', type=int, default=100000)
+    parser.add_argument('--businesses', type=int, help='Default: one per 2000 subscriptions.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.database)}'
+    from app import create_app
+    from migrations import upgrade_database
+    with create_app('production').app_context():
+        upgrade_database()
+        started = time.perf_counter()
+        summary = generate(args.subscriptions, args.businesses, args.seed)
+        elapsed = time.perf_counter() - started
+
+    largest = summary['businesses'][0]
+    print(f"{len(summary['businesses'])} businesses, {summary['plans']} plans, {summary['customers']} customers, "
+          f"{summary['subscriptions']} subscriptions, {summary['payments']} payments in {elapsed:.1f}s")
+    print(f"Largest business: {largest[0]} with {largest[1]} subscriptions "
+          f"(log in as owner{largest[0]}@example.com / {PASSWORD})")
+
+if __name__ == "__main__":
+    run()
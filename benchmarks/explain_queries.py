@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Query plan check for the tenant-scoped hot queries
+Runs each route/engine query against a seeded throwaway SQLite database,
+captures the SQL it issues and fails if EXPLAIN QUERY PLAN shows a full
+table scan of a data table, or a rowid range walk of one for a query
+filtered by business_id. Queries run for a large and a small tenant, and
+the list pages also with a cursor deep into the large one.
+"""
+
+import os
+import re
+import sys
+import tempfile
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func
+from models import db, Plan, Customer, Subscription, Payment
+from metrics import compute_business_metrics, get_business_metrics, record_plan_repriced
+from billing import count_due_subscriptions, due_subscriptions_chunk
+from jobs import enqueue_due_businesses, claim_next_job
+from listing import list_customers, list_subscriptions, encode_cursor
+from analytics import cohort_retention, plan_ltv
+from snapshots import compute_snapshots, monthly_timeseries
+from bench_metrics import make_app, seed
+
+DATA_TABLES = {'businesses', 'plans', 'customers', 'subscriptions', 'payments', 'billing_jobs', 'business_metrics',
+               'metrics_snapshots'}
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?! USING)')
+# Walking the primary key from a bound reads every tenant's rows past it, so it counts as a scan for tenant queries
+ROWID_RANGE = re.compile(r'^SEARCH (\w+) USING INTEGER PRIMARY KEY \(rowid[<>]')
+TENANT_FILTER = re.compile(r'\bbusiness_id = \?')
+
+def is_scan(detail, statement):
+    match = FULL_SCAN.match(detail) or (TENANT_FILTER.search(statement) and ROWID_RANGE.match(detail))
+    return bool(match) and match.group(1) in DATA_TABLES
+
+def deep_cursor(query, expression, id_column):
+    """A cursor nine tenths of the way through query ordered by (expression, id_column)"""
+    total = query.count()
+    row = query.with_entities(expression, id_column).order_by(expression, id_column).offset(total * 9 // 10).first()
+    return encode_cursor(row[0], row[1])
+
+def route_queries(business_id):
+    """The queries routes.py issues, keyed by a readable name"""
+    today = date.today()
+    plan = Plan.query.filter_by(business_id=business_id).first()
+    customers = Customer.query.filter_by(business_id=business_id)
+    subscriptions = Subscription.query.filter_by(business_id=business_id)
+    deep = {
+        'name': deep_cursor(customers, func.lower(Customer.full_name), Customer.customer_id),
+        'joined': deep_cursor(customers, Customer.created_at, Customer.customer_id),
+        'id': deep_cursor(subscriptions, Subscription.subscription_id, Subscription.subscription_id),
+        'start_date': deep_cursor(subscriptions, Subscription.start_date, Subscription.subscription_id),
+    }
+    return {
+        'plans_route': lambda: Plan.query.filter_by(business_id=business_id).all(),
+        'customers_route': lambda: Customer.query.filter_by(business_id=business_id).all(),
+        'subscriptions_route': lambda: Subscription.query.filter_by(business_id=business_id).all(),
+        'cancel_subscription_route': lambda: Subscription.query.filter_by(
+            subscription_id=1, business_id=business_id).first(),
+        'customers_search': lambda: list_customers(
+            Customer.query.filter_by(business_id=business_id), search='cust', sort='name'),
+        'customers_page_by_email': lambda: list_customers(
+            Customer.query.filter_by(business_id=business_id), sort='email', cursor='WyJjMTBAZXhhbXBsZS5jb20iLCAxMF0'),
+        'subscriptions_page': lambda: list_subscriptions(
+            Subscription.query.filter_by(business_id=business_id), business_id, status='active', cursor='WzUwLCA1MF0'),
+        'customers_deep_by_name': lambda: list_customers(customers, sort='name', cursor=deep['name']),
+        'customers_deep_by_joined': lambda: list_customers(customers, sort='joined', cursor=deep['joined']),
+        'subscriptions_deep_by_id': lambda: list_subscriptions(subscriptions, business_id, cursor=deep['id']),
+        'subscriptions_deep_by_start': lambda: list_subscriptions(
+            subscriptions, business_id, sort='start_date', cursor=deep['start_date']),
+        'subscriptions_search': lambda: list_subscriptions(
+            Subscription.query.filter_by(business_id=business_id), business_id, search='c1', sort='start_date'),
+        'subscription_payments': lambda: Payment.query.filter_by(subscription_id=1).order_by(Payment.payment_date).all(),
+        'compute_business_metrics': lambda: compute_business_metrics(business_id),
+        'get_business_metrics': lambda: get_business_metrics(business_id),
+        'record_plan_repriced': lambda: record_plan_repriced(business_id, plan, 0, plan.billing_interval),
+        'count_due_subscriptions': lambda: count_due_subscriptions(business_id, today),
+        'due_subscriptions_chunk': lambda: due_subscriptions_chunk(business_id, today, 0, 1000),
+        'enqueue_due_businesses': lambda: enqueue_due_businesses(today),
+        'claim_next_job': claim_next_job,
+        'cohort_retention': lambda: cohort_retention(business_id),
+        'plan_ltv': lambda: plan_ltv(business_id),
+        'compute_snapshots': lambda: list(compute_snapshots(today, today, business_id)),
+        'monthly_timeseries': lambda: monthly_timeseries(business_id, today, today),
+    }
+
+def capture_selects(fn):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+def run():
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'explain.db'))
+        with app.app_context():
+            db.create_all()
+            # Several tenants so the planner sees business_id as selective, and a small one
+            tenants = {'large': [seed(1000, f'tenant{i}') for i in range(20)][0], 'small': seed(10, 'small')}
+            db.session.execute(db.text('ANALYZE'))
+            db.session.commit()
+
+            for tenant, business_id in tenants.items():
+                print(f"{tenant} tenant")
+                for name, fn in route_queries(business_id).items():
+                    for statement, parameters in capture_selects(fn):
+                        plan = db.session.connection().exec_driver_sql(
+                            f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+                        details = [row[-1] for row in plan]
+                        scans = [d for d in details if is_scan(d, statement)]
+                        status = 'FULL SCAN' if scans else 'ok'
+                        failures += bool(scans)
+                        print(f"{name:<28} {status:<10} {'; '.join(details)}")
+                    db.session.rollback()
+
+    if failures:
+        print(f"\n{failures} statement(s) fall back to a full table scan")
+        sys.exit(1)
+    print("\nAll statements use an index")
+
+if __name__ == "__main__":
+    run()
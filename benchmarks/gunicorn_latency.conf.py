@@ -0,0 +1,23 @@
+"""
+gunicorn.conf.py plus a simulated database round trip of BENCH_DB_LATENCY_MS
+per SQL statement, so load_test.py can model a remote database where
+workers wait on I/O rather than CPU
+"""
+
+import os
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+exec(open(os.path.join(ROOT, 'gunicorn.conf.py')).read())
+
+LATENCY = float(os.getenv('BENCH_DB_LATENCY_MS', '0')) / 1000
+
+def post_worker_init(worker):
+    from sqlalchemy import event
+    from models import db
+
+    def wait_for_database(*args):
+        time.sleep(LATENCY)  # cooperative under gevent's monkey patching
+
+    with worker.wsgi.app_context():
+        event.listen(db.engine, 'before_cursor_execute', wait_for_database)
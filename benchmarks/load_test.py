@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Load test for the read-only JSON API under each gunicorn worker class
+Starts gunicorn against a seeded throwaway SQLite database once per worker
+class (sync, gthread, and gevent when installed), opens CONCURRENCY client
+connections that poll metrics, customer and subscription reads for DURATION
+seconds, and reports requests/sec, p50/p99 latency and errors. With
+--db-latency each SQL statement also waits that many milliseconds, as it
+would on a database across the network.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PATHS = ['/api/v1/metrics', '/api/v1/customers?limit=50', '/api/v1/subscriptions?limit=50']
+EMAIL = 'loadtest@example.com'
+PASSWORD = 'loadtest'
+SUBSCRIPTIONS = 20000
+CONCURRENCY = 200
+DURATION = 15  # seconds
+REQUEST_TIMEOUT = 30  # seconds
+
+def prepare_database(path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from migrations import upgrade_database
+    from models import db, Business
+    from bench_metrics import seed
+    with create_app().app_context():
+        upgrade_database()
+        business = db.session.get(Business, seed(SUBSCRIPTIONS, 'loadtest'))
+        business.password_hash = generate_password_hash(PASSWORD)
+        db.session.commit()
+        db.session.remove()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(worker_class, workers, port, db_latency=0):
+    command = [sys.executable, '-m', 'gunicorn', 'app:create_app()', '--bind', f'127.0.0.1:{port}',
+               '--worker-class', worker_class, '--workers', str(workers), '--log-level', 'warning']
+    if worker_class == 'sync':
+        command += ['--threads', '1']  # gunicorn runs gthread instead of sync when threads > 1
+    if db_latency:
+        command += ['--config', os.path.join(ROOT, 'benchmarks', 'gunicorn_latency.conf.py')]
+    env = dict(os.environ, FLASK_CONFIG='production', BENCH_DB_LATENCY_MS=str(db_latency))
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f'gunicorn ({worker_class}) did not start')
+
+def login(port):
+    connection = HTTPConnection('127.0.0.1', port, timeout=REQUEST_TIMEOUT)
+    connection.request('POST', '/login', body=urlencode({'email': EMAIL, 'password': PASSWORD}),
+                       headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie')
+    if response.status != 302 or not cookie:
+        raise RuntimeError(f'login failed with {response.status}')
+    return cookie.split(';', 1)[0]
+
+async def fetch(port, path, cookie):
+    """One request on a fresh connection; returns the status code"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write((f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n'
+                      f'Connection: close\r\n\r\n').encode())
+        await writer.drain()
+        response = await reader.read()
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+async def client(port, cookie, deadline, offset, latencies, errors):
+    count = offset
+    while time.perf_counter() < deadline:
+        path = PATHS[count % len(PATHS)]
+        count += 1
+        started = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(fetch(port, path, cookie), REQUEST_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+            status = None
+        if status == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(status)
+
+async def generate_load(port, cookie, concurrency, duration):
+    latencies, errors = [], []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*[client(port, cookie, deadline, i, latencies, errors) for i in range(concurrency)])
+    return latencies, errors, time.perf_counter() - started
+
+def worker_classes():
+    classes = ['sync', 'gthread']
+    try:
+        import gevent  # noqa: F401
+        classes.append('gevent')
+    except ImportError:
+        print("gevent is not installed; skipping the gevent worker")
+    return classes
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--duration', type=int, default=DURATION)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--worker-class', action='append', help='Only test these worker classes.')
+    parser.add_argument('--db-latency', type=float, default=0, help='Milliseconds added to every SQL statement.')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare_database(os.path.join(tmp, 'load.db'))
+        for worker_class in args.worker_class or worker_classes():
+            port = free_port()
+            server = start_server(worker_class, args.workers, port, args.db_latency)
+            try:
+                cookie = login(port)
+                latencies, errors, elapsed = asyncio.run(
+                    generate_load(port, cookie, args.concurrency, args.duration))
+            finally:
+                server.terminate()
+                server.wait()
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000 if latencies else 0
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+            results.append((worker_class, len(latencies) / elapsed, p50, p99, len(errors)))
+
+    print(f"\n{args.concurrency} connections, {args.workers} worker(s), {args.duration}s, "
+          f"{args.db_latency:g}ms per SQL statement")
+    print(f"{'worker class':<14} {'req/sec':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for worker_class, rate, p50, p99, errors in results:
+        print(f"{worker_class:<14} {rate:>10.0f} {p50:>10.1f} {p99:>10.1f} {errors:>8}")
+
+if __name__ == "__main__":
+    run()
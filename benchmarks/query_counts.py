@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Query-count check for the list pages
+Renders each list page for a small and a large tenant and fails if any page
+issues more than MAX_STATEMENTS SQL statements or if the count grows with
+the number of rows (an N+1 pattern)
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP.name, 'query_counts.db')}"
+
+from sqlalchemy import event
+from app import create_app
+from models import db
+from bench_metrics import seed
+
+PAGES = ['/dashboard', '/plans', '/customers', '/subscriptions', '/subscriptions/new']
+SCALES = [20, 2000]
+MAX_STATEMENTS = 6
+
+app = create_app()
+
+def count_statements(client, path):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200, f"{path} returned {response.status_code}"
+    return len(statements)
+
+def run():
+    with app.app_context():
+        db.create_all()
+
+    counts = {}
+    for count in SCALES:
+        with app.app_context():
+            business_id = seed(count, f'tenant{count}')
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(business_id)
+            session['_fresh'] = True
+
+        # The first dashboard hit builds the metrics rollup once; measure steady state
+        client.get('/dashboard')
+        for path in PAGES:
+            counts.setdefault(path, []).append(count_statements(client, path))
+
+    failures = 0
+    print(f"{'page':<22} " + ' '.join(f'{count:>8}' for count in SCALES))
+    for path, page_counts in counts.items():
+        bad = max(page_counts) > MAX_STATEMENTS or len(set(page_counts)) > 1
+        failures += bad
+        print(f"{path:<22} " + ' '.join(f'{n:>8}' for n in page_counts) + ('  FAIL' if bad else ''))
+
+    if failures:
+        print(f"\n{failures} page(s) exceed {MAX_STATEMENTS} statements or grow with row count")
+        sys.exit(1)
+    print(f"\nAll pages stay within {MAX_STATEMENTS} statements")
+
+if __name__ == "__main__":
+    run()
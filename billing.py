@@ -0,0 +1,247 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import bindparam
+from models import db, Plan, Subscription, Payment
+from metrics import apply_metrics_delta
+from cache import mark_business_dirty
+from gateway import get_gateway
+
+CHUNK_SIZE = 1000
+RETRY_BACKOFF_HOURS = [24, 72, 168]  # wait before each retry of a declined payment; canceled when the last fails
+RETRY_BATCH_SIZE = 500
+
+def billing_interval_days(billing_interval):
+    return 30 if billing_interval == 'monthly' else 365  # yearly
+
+def due_subscriptions_chunk(business_id, today, after_id, chunk_size):
+    """Fetch and lock the next keyset page of due subscriptions with their plan price preloaded
+
+    The rows stay locked (FOR UPDATE, a no-op on SQLite) until the caller
+    commits, so nothing moves them between the read and the chunk's charge.
+    """
+    return db.session.query(
+        Subscription.subscription_id,
+        Subscription.next_billing_date,
+        Plan.price,
+        Plan.billing_interval
+    ).join(Plan, Subscription.plan_id == Plan.plan_id).filter(
+        Subscription.business_id == business_id,
+        Subscription.status == 'active',
+        Subscription.next_billing_date <= today,
+        Subscription.subscription_id > after_id
+    ).order_by(Subscription.subscription_id).limit(chunk_size).with_for_update(of=Subscription).all()
+
+def retry_delay(retry_count):
+    return timedelta(hours=RETRY_BACKOFF_HOURS[retry_count])
+
+def active_deltas(charges, sign):
+    """Rollup deltas for subscriptions, given as (price, billing_interval), leaving (-1) or rejoining (1) active"""
+    deltas = {'active_subscribers': sign * len(charges)}
+    for price, billing_interval in charges:
+        field = 'monthly_price_total' if billing_interval == 'monthly' else 'yearly_price_total'
+        deltas[field] = deltas.get(field, 0) + sign * price
+    return deltas
+
+def advance_billing_dates(next_dates, **values):
+    """Move each subscription from b_billing_date to b_next_billing_date (plus any fixed values) with one executemany UPDATE
+
+    A subscription whose next_billing_date is no longer b_billing_date is
+    left alone. Returns the IDs it advanced. Callers hold the rows locked,
+    so when the rowcount falls short (or the driver cannot report one) the
+    new dates tell which rows moved.
+    """
+    if not next_dates:
+        return set()
+    table = Subscription.__table__
+    advanced = db.session.execute(
+        db.update(table)
+        .where(table.c.subscription_id == bindparam('b_subscription_id'),
+               table.c.next_billing_date == bindparam('b_billing_date'))
+        .values(next_billing_date=bindparam('b_next_billing_date'), **values),
+        next_dates
+    ).rowcount
+    new_dates = {row['b_subscription_id']: row['b_next_billing_date'] for row in next_dates}
+    if advanced == len(new_dates):
+        return set(new_dates)
+    return {subscription_id for subscription_id, next_billing_date in db.session.query(
+        Subscription.subscription_id, Subscription.next_billing_date
+    ).filter(Subscription.subscription_id.in_(list(new_dates))) if next_billing_date == new_dates[subscription_id]}
+
+def bill_chunk(business_id, rows, before_commit=None, now=None):
+    """Charge one chunk through the payment gateway, record its payments and commit it
+
+    Paid subscriptions advance to their next billing date, with an UPDATE
+    conditional on the date that was read, and only the ones it advanced
+    get a paid payment and count as collected. Declined ones keep theirs,
+    become past_due and get a first retry scheduled for retry_due_payments.
+    before_commit, if given, runs inside the chunk's transaction so callers
+    can record a resume cursor atomically with the payments it covers.
+    """
+    now = now or datetime.utcnow()
+    results = get_gateway().charge([(subscription_id, price) for subscription_id, _, price, _ in rows])
+    prices = {}
+    next_dates = []
+    declined = {}
+    for (subscription_id, next_billing_date, price, billing_interval), paid in zip(rows, results):
+        prices[subscription_id] = price
+        if not paid:
+            declined[subscription_id] = (price, billing_interval)
+            continue
+        next_dates.append({
+            'b_subscription_id': subscription_id,
+            'b_billing_date': next_billing_date,
+            'b_next_billing_date': next_billing_date + timedelta(days=billing_interval_days(billing_interval))
+        })
+
+    advanced = advance_billing_dates(next_dates)
+    payments = [{'business_id': business_id, 'subscription_id': subscription_id, 'amount': prices[subscription_id],
+                 'status': 'failed' if subscription_id in declined else 'paid'}
+                for subscription_id in prices if subscription_id in advanced or subscription_id in declined]
+    collected = sum((prices[subscription_id] for subscription_id in advanced), Decimal('0.0'))
+    if payments:
+        db.session.execute(db.insert(Payment), payments)
+        mark_business_dirty(db.session, business_id)  # bulk inserts skip the flush hooks; the payments export changes
+    deltas = {}
+    if declined:
+        db.session.execute(
+            db.update(Subscription).where(Subscription.subscription_id.in_(list(declined)))
+            .values(status='past_due', retry_count=0, next_retry_at=now + retry_delay(0))
+            .execution_options(synchronize_session=False)
+        )
+        deltas = active_deltas(list(declined.values()), -1)
+    if collected or deltas:
+        apply_metrics_delta(business_id, revenue_collected=collected, **deltas)
+    if before_commit:
+        before_commit()
+    db.session.commit()
+
+def count_due_subscriptions(business_id, today=None):
+    today = today or date.today()
+    return db.session.query(Subscription.subscription_id).filter(
+        Subscription.business_id == business_id,
+        Subscription.status == 'active',
+        Subscription.next_billing_date <= today
+    ).count()
+
+def run_billing(business_id, today=None, chunk_size=CHUNK_SIZE, progress=None, after_id=0, claim=None):
+    """Bill every due active subscription of a business in keyset-paginated chunks
+
+    Each chunk is committed on its own so memory stays bounded and the write
+    lock is only held for one chunk at a time. progress, if given, is called
+    as progress(processed_count, last_id) inside each chunk's transaction.
+    claim, if given, is called first in each chunk's transaction, before
+    its rows are read and charged, and raises to stop the run (a billing
+    job checks its lease there). after_id resumes a run after the given
+    subscription_id. Returns the number billed.
+    """
+    today = today or date.today()
+    processed_count = 0
+    last_id = after_id
+    while True:
+        if claim:
+            claim()
+        rows = due_subscriptions_chunk(business_id, today, last_id, chunk_size)
+        if not rows:
+            break
+        processed_count += len(rows)
+        last_id = rows[-1].subscription_id
+        bill_chunk(business_id, rows,
+                   before_commit=(lambda: progress(processed_count, last_id)) if progress else None)
+    return processed_count
+
+# Dunning: declined payments are retried with backoff until paid or out of retries
+def due_retries(now, batch_size):
+    """Lock the next batch of past_due subscriptions whose retry is due, oldest first, across businesses"""
+    return db.session.query(
+        Subscription.subscription_id,
+        Subscription.business_id,
+        Subscription.retry_count,
+        Subscription.next_billing_date,
+        Plan.price,
+        Plan.billing_interval
+    ).join(Plan, Subscription.plan_id == Plan.plan_id).filter(
+        Subscription.next_retry_at <= now,
+        Subscription.status == 'past_due'
+    ).order_by(Subscription.next_retry_at, Subscription.subscription_id).limit(batch_size).with_for_update(
+        skip_locked=True, of=Subscription
+    ).all()
+
+def retry_due_payments(now=None, batch_size=RETRY_BATCH_SIZE, today=None):
+    """Retry one batch of due declined payments through the gateway and commit it
+
+    Recovered subscriptions become active again and advance to their next
+    billing date. Declined ones wait for the next RETRY_BACKOFF_HOURS step,
+    and those out of retries are canceled. Every transition is one set-based
+    UPDATE per outcome, and each business's rollup moves in the same
+    transaction. Batches are small so a retry storm only ever delays billing
+    jobs by one batch. now (UTC) schedules retries; cancellation dates and
+    rollup months use today, the local date like everywhere else. Returns
+    {'retried', 'recovered', 'declined', 'canceled'}.
+    """
+    now = now or datetime.utcnow()
+    today = today or date.today()
+    rows = due_retries(now, batch_size)
+    report = {'retried': len(rows), 'recovered': 0, 'declined': 0, 'canceled': 0}
+    if not rows:
+        db.session.commit()
+        return report
+
+    results = get_gateway().charge([(row.subscription_id, row.price) for row in rows])
+    payments = []
+    recovered = {}  # subscription_id -> row
+    backoff = {}  # retry_count -> subscription IDs
+    canceled = []
+    deltas = {}  # business_id -> rollup deltas
+    for row, paid in zip(rows, results):
+        business_deltas = deltas.setdefault(row.business_id, {})
+        if paid:
+            recovered[row.subscription_id] = row
+            continue
+        payments.append({'business_id': row.business_id, 'subscription_id': row.subscription_id,
+                         'amount': row.price, 'status': 'failed'})
+        if row.retry_count + 1 < len(RETRY_BACKOFF_HOURS):
+            backoff.setdefault(row.retry_count + 1, []).append(row.subscription_id)
+        else:
+            canceled.append(row.subscription_id)
+            business_deltas['canceled'] = business_deltas.get('canceled', 0) + 1
+
+    # Like bill_chunk, only the subscriptions actually advanced record a paid payment
+    advanced = advance_billing_dates([{
+        'b_subscription_id': row.subscription_id,
+        'b_billing_date': row.next_billing_date,
+        'b_next_billing_date': row.next_billing_date + timedelta(days=billing_interval_days(row.billing_interval))
+    } for row in recovered.values()], status='active', retry_count=0, next_retry_at=None)
+    for subscription_id in sorted(advanced):
+        row = recovered[subscription_id]
+        payments.append({'business_id': row.business_id, 'subscription_id': subscription_id,
+                         'amount': row.price, 'status': 'paid'})
+        business_deltas = deltas[row.business_id]
+        for field, value in active_deltas([(row.price, row.billing_interval)], 1).items():
+            business_deltas[field] = business_deltas.get(field, 0) + value
+        business_deltas['revenue_collected'] = business_deltas.get('revenue_collected', 0) + row.price
+
+    if payments:
+        db.session.execute(db.insert(Payment), payments)
+    for retry_count, subscription_ids in backoff.items():
+        db.session.execute(
+            db.update(Subscription).where(Subscription.subscription_id.in_(subscription_ids))
+            .values(retry_count=retry_count, next_retry_at=now + retry_delay(retry_count))
+            .execution_options(synchronize_session=False)
+        )
+    if canceled:
+        db.session.execute(
+            db.update(Subscription).where(Subscription.subscription_id.in_(canceled))
+            .values(status='canceled', cancellation_date=today, retry_count=len(RETRY_BACKOFF_HOURS),
+                    next_retry_at=None)
+            .execution_options(synchronize_session=False)
+        )
+    for business_id, business_deltas in sorted(deltas.items()):
+        mark_business_dirty(db.session, business_id)  # new payments, even when the rollup does not move
+        if business_deltas:
+            apply_metrics_delta(business_id, today=today, **business_deltas)
+    db.session.commit()
+
+    report['recovered'] = len(advanced)
+    report['declined'] = sum(len(subscription_ids) for subscription_ids in backoff.values())
+    report['canceled'] = len(canceled)
+    return report
@@ -0,0 +1,186 @@
+from datetime import date, timedelta
+from sqlalchemy import bindparam, func, or_
+from models import db, Plan, Subscription
+from billing import billing_interval_days
+from metrics import apply_metrics_delta
+from cache import mark_business_dirty
+from listing import SUBSCRIPTION_STATUSES
+
+CHUNK_SIZE = 5000
+MAX_SUBSCRIPTION_IDS = 100000
+OPERATIONS = ['cancel', 'migrate', 'reschedule']
+
+def subscription_conditions(business_id, plan_id=None, status=None, start_from=None, start_to=None):
+    """WHERE conditions selecting a business's subscriptions by plan, status and start_date range"""
+    if status is not None and status not in SUBSCRIPTION_STATUSES:
+        raise ValueError(f'status must be one of {", ".join(SUBSCRIPTION_STATUSES)}')
+    conditions = [Subscription.business_id == business_id]
+    if plan_id is not None:
+        conditions.append(Subscription.plan_id == plan_id)
+    if status is not None:
+        conditions.append(Subscription.status == status)
+    if start_from is not None:
+        conditions.append(Subscription.start_date >= start_from)
+    if start_to is not None:
+        conditions.append(Subscription.start_date <= start_to)
+    return conditions
+
+def count_matching(conditions, subscription_ids, chunk_size):
+    if subscription_ids is None:
+        return db.session.query(func.count(Subscription.subscription_id)).filter(*conditions).scalar()
+    ids = sorted(set(subscription_ids))
+    return sum(db.session.query(func.count(Subscription.subscription_id)).filter(
+        *conditions, Subscription.subscription_id.in_(ids[start:start + chunk_size])).scalar()
+        for start in range(0, len(ids), chunk_size))
+
+def chunks(conditions, subscription_ids, chunk_size):
+    """Yield extra conditions covering up to chunk_size matching subscriptions each
+
+    Every chunk first locks its rows (FOR UPDATE, a no-op on SQLite) in the
+    transaction the caller then commits, so the rollup deltas computed for
+    a chunk match the rows its UPDATE changes.
+    """
+    if subscription_ids is not None:
+        ids = sorted(set(subscription_ids))
+        for start in range(0, len(ids), chunk_size):
+            chunk = [Subscription.subscription_id.in_(ids[start:start + chunk_size])]
+            if db.session.query(Subscription.subscription_id).filter(*conditions, *chunk).with_for_update().all():
+                yield chunk
+        return
+
+    after_id = 0
+    while True:
+        rows = db.session.query(Subscription.subscription_id).filter(
+            *conditions, Subscription.subscription_id > after_id
+        ).order_by(Subscription.subscription_id).limit(chunk_size).with_for_update().all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [Subscription.subscription_id > after_id, Subscription.subscription_id <= last_id]
+        after_id = last_id
+
+def active_price_totals(where):
+    """Active subscription count and price total per billing interval for the matching rows"""
+    is_active = Subscription.status == 'active'
+    totals = {}
+    for billing_interval, active, price_total in db.session.query(
+        Plan.billing_interval, func.count(Subscription.subscription_id).filter(is_active),
+        func.sum(Plan.price).filter(is_active)
+    ).join(Plan, Subscription.plan_id == Plan.plan_id).filter(*where).group_by(Plan.billing_interval):
+        totals[billing_interval] = (active, price_total or 0)
+    return totals
+
+def remove_active_totals(totals):
+    deltas = {'active_subscribers': -sum(active for active, _ in totals.values())}
+    for billing_interval, (_, price_total) in totals.items():
+        field = 'monthly_price_total' if billing_interval == 'monthly' else 'yearly_price_total'
+        deltas[field] = deltas.get(field, 0) - price_total
+    return deltas
+
+# Operations: each applies one chunk and returns the rows it updated
+def cancel_chunk(business_id, where, today, **options):
+    current_month = today.replace(day=1)
+    deltas = remove_active_totals(active_price_totals(where))
+    deltas['canceled'] = db.session.query(func.count(Subscription.subscription_id)).filter(
+        *where, or_(Subscription.cancellation_date.is_(None), Subscription.cancellation_date < current_month)
+    ).scalar()
+    result = db.session.execute(
+        db.update(Subscription).where(*where).values(status='canceled', cancellation_date=today)
+        .execution_options(synchronize_session=False)
+    )
+    apply_metrics_delta(business_id, today=today, **deltas)
+    return result.rowcount
+
+def migrate_chunk(business_id, where, today, target_plan=None, **options):
+    totals = active_price_totals(where)
+    deltas = remove_active_totals(totals)
+    deltas['active_subscribers'] = 0  # they stay active, on another plan
+    moved = sum(active for active, _ in totals.values())
+    field = 'monthly_price_total' if target_plan.billing_interval == 'monthly' else 'yearly_price_total'
+    deltas[field] = deltas.get(field, 0) + target_plan.price * moved
+    result = db.session.execute(
+        db.update(Subscription).where(*where).values(plan_id=target_plan.plan_id)
+        .execution_options(synchronize_session=False)
+    )
+    apply_metrics_delta(business_id, **deltas)
+    return result.rowcount
+
+def reschedule_chunk(business_id, where, today, next_billing_date=None, **options):
+    """Set next_billing_date to a fixed date, or to each subscription's first billing date from today on"""
+    if next_billing_date is not None:
+        result = db.session.execute(
+            db.update(Subscription).where(*where).values(next_billing_date=next_billing_date)
+            .execution_options(synchronize_session=False)
+        )
+        updated = result.rowcount
+    else:
+        dates = []
+        for subscription_id, start_date, billing_interval in db.session.query(
+            Subscription.subscription_id, Subscription.start_date, Plan.billing_interval
+        ).join(Plan, Subscription.plan_id == Plan.plan_id).filter(*where):
+            days = billing_interval_days(billing_interval)
+            periods = max(-(-(today - start_date).days // days), 1)  # ceiling division
+            dates.append({'b_subscription_id': subscription_id,
+                          'b_next_billing_date': start_date + timedelta(days=periods * days)})
+        if dates:
+            db.session.execute(
+                db.update(Subscription.__table__)
+                .where(Subscription.__table__.c.subscription_id == bindparam('b_subscription_id'))
+                .values(next_billing_date=bindparam('b_next_billing_date')),
+                dates
+            )
+        updated = len(dates)
+    mark_business_dirty(db.session, business_id)  # bulk UPDATEs skip the flush hooks
+    return updated
+
+OPERATION_CHUNKS = {
+    'cancel': cancel_chunk,
+    'migrate': migrate_chunk,
+    'reschedule': reschedule_chunk,
+}
+
+def bulk_update_subscriptions(business_id, operation, plan_id=None, status=None, start_from=None, start_to=None,
+                              subscription_ids=None, target_plan_id=None, next_billing_date=None,
+                              dry_run=False, chunk_size=CHUNK_SIZE, today=None):
+    """Cancel, migrate to another plan or reschedule a business's subscriptions in chunks
+
+    Subscriptions are selected by plan, status and start_date range, and/or
+    an explicit list of IDs. Each chunk is one transaction of set-based
+    statements that also moves the business_metrics rollup, so the rollup
+    stays consistent even if a later chunk fails. Canceled subscriptions are
+    skipped by cancel and reschedule, as are those already on the target
+    plan by migrate. With dry_run nothing is written and updated is 0.
+    Returns {'operation', 'matched', 'updated', 'dry_run'}.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f'operation must be one of {", ".join(OPERATIONS)}')
+    if subscription_ids is not None and len(subscription_ids) > MAX_SUBSCRIPTION_IDS:
+        raise ValueError(f'at most {MAX_SUBSCRIPTION_IDS} subscription_ids per request')
+    if subscription_ids is None and plan_id is None and status is None and start_from is None and start_to is None:
+        raise ValueError('give a plan_id, status, start date range or subscription_ids')
+    today = today or date.today()
+
+    conditions = subscription_conditions(business_id, plan_id, status, start_from, start_to)
+    options = {}
+    if operation == 'migrate':
+        target_plan = Plan.query.filter_by(plan_id=target_plan_id, business_id=business_id).first() \
+            if target_plan_id is not None else None
+        if target_plan is None:
+            raise ValueError('target_plan_id must be one of your plans')
+        conditions.append(Subscription.plan_id != target_plan.plan_id)
+        options['target_plan'] = target_plan
+    else:
+        conditions.append(Subscription.status != 'canceled')
+        options['next_billing_date'] = next_billing_date
+
+    report = {'operation': operation, 'matched': 0, 'updated': 0, 'dry_run': dry_run}
+    if dry_run:
+        report['matched'] = count_matching(conditions, subscription_ids, chunk_size)
+        return report
+
+    for chunk in chunks(conditions, subscription_ids, chunk_size):
+        updated = OPERATION_CHUNKS[operation](business_id, conditions + chunk, today, **options)
+        db.session.commit()
+        report['matched'] += updated
+        report['updated'] += updated
+    return report
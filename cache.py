@@ -0,0 +1,173 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from models import Business, Plan, Customer, Subscription, Payment
+
+DEFAULT_TTL = 60  # seconds
+DEFAULT_MAX_ENTRIES = 10000
+
+class CacheStats:
+    """Hit/miss counters for a cache backend (per process)"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None
+        }
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self.stats.invalidations += 1
+
+class SQLiteCache:
+    """Cache stored in a local SQLite file so every gunicorn worker on a host shares it
+
+    Values must be JSON-serializable. Expired rows are ignored on read and
+    overwritten on the next set.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._pool = queue.LifoQueue()
+        self._lock = threading.Lock()  # guards stats; the SQLite file does its own locking
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection; one per thread would pile up under gevent's per-request greenlets"""
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    def get(self, key):
+        with self._connection() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? AND expires_at >= ?', (key, time.time())
+            ).fetchone()
+        with self._lock:
+            if row is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + self.ttl)
+            )
+
+    def delete(self, key):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+        with self._lock:
+            self.stats.invalidations += 1
+
+def create_cache(app):
+    """Build the cache backend selected by the METRICS_CACHE setting ('memory', 'sqlite' or 'none')"""
+    backend = app.config.get('METRICS_CACHE', 'memory')
+    ttl = int(app.config.get('METRICS_CACHE_TTL', DEFAULT_TTL))
+    if backend == 'memory':
+        return MemoryCache(ttl=ttl)
+    if backend == 'sqlite':
+        path = app.config.get('METRICS_CACHE_PATH') or os.path.join(app.instance_path, 'metrics_cache.db')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return SQLiteCache(path, ttl=ttl)
+    return None
+
+def init_cache(app, session):
+    """Attach the configured cache to the app and invalidate it after commits on session"""
+    app.extensions['metrics_cache'] = create_cache(app)
+    register_invalidation(session)
+
+def get_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('metrics_cache')
+
+def metrics_key(business_id):
+    return f'metrics:{business_id}'
+
+# Write-through invalidation
+def mark_business_dirty(session, business_id):
+    """Invalidate a business's cached metrics (and bump its version) once the session's transaction commits"""
+    if business_id is not None:
+        session.info.setdefault('dirty_businesses', set()).add(business_id)
+
+def invalidate_on_flush(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        # Business too: its name is rendered on every page, so an edit must change the tenant's ETags
+        if isinstance(obj, (Business, Plan, Customer, Subscription, Payment)):
+            mark_business_dirty(session, obj.business_id)
+
+def invalidate_on_commit(session):
+    dirty = session.info.pop('dirty_businesses', None)
+    cache = get_cache()
+    if dirty and cache is not None:
+        for business_id in dirty:
+            cache.delete(metrics_key(business_id))
+
+def discard_on_rollback(session):
+    session.info.pop('dirty_businesses', None)
+
+def register_invalidation(session):
+    if not event.contains(session, 'before_flush', invalidate_on_flush):
+        event.listen(session, 'before_flush', invalidate_on_flush)
+        event.listen(session, 'after_commit', invalidate_on_commit)
+        event.listen(session, 'after_rollback', discard_on_rollback)
@@ -0,0 +1,232 @@
+import os
+import time
+from datetime import date, timedelta
+import click
+from flask.cli import with_appcontext
+from models import db, Business
+from metrics import rebuild_business_metrics, reconcile_business_metrics
+from billing import retry_due_payments, CHUNK_SIZE, RETRY_BATCH_SIZE
+from jobs import enqueue_due_businesses
+from migrations import upgrade_database, backfill_business_ids, find_business_id_drift
+from snapshots import write_snapshots
+from analytics import REPORTS as ANALYTICS_REPORTS
+from importer import import_records, detect_format, IMPORT_KINDS
+from bulk import bulk_update_subscriptions, OPERATIONS as BULK_OPERATIONS
+from archive import archive_payments
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Create missing tables, columns and indexes (run once per deploy, not on startup)"""
+    changes = upgrade_database()
+    for change in changes:
+        print(change)
+    print(f"Database is up to date ({len(changes)} change(s) applied)")
+
+@click.command('rebuild-metrics')
+@with_appcontext
+@click.option('--check', is_flag=True, help='Only report drift between rollups and live tables.')
+def rebuild_metrics_command(check):
+    """Rebuild (or check) the business_metrics rollup for every business"""
+    drifted = 0
+    for (business_id,) in db.session.query(Business.business_id).order_by(Business.business_id):
+        drift = reconcile_business_metrics(business_id)
+        if drift:
+            drifted += 1
+            for field, (stored, live) in drift.items():
+                print(f"Business {business_id}: {field} rollup={stored} live={live}")
+        if not check:
+            rebuild_business_metrics(business_id)
+            db.session.commit()
+
+    if check:
+        print(f"{drifted} business(es) with drifted metrics")
+    else:
+        print(f"Metrics rebuilt ({drifted} business(es) had drifted)")
+
+@click.command('check-business-ids')
+@with_appcontext
+@click.option('--fix', is_flag=True, help='Re-copy business_id from customers and subscriptions.')
+def check_business_ids_command(fix):
+    """Check denormalized business_id columns against Customer.business_id"""
+    drift = find_business_id_drift()
+    print(f"{drift['subscriptions']} subscription(s) and {drift['payments']} payment(s) with drifted business_id")
+    if fix and (drift['subscriptions'] or drift['payments']):
+        for change in backfill_business_ids(db.session.connection(), only_missing=False):
+            print(change)
+        db.session.commit()
+
+@click.command('import-data')
+@with_appcontext
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--business-id', type=int, required=True, help='Business to import into.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+def import_data_command(kind, path, business_id, fmt):
+    """Stream a CSV/NDJSON file of customers, plans or subscriptions into a business"""
+    if db.session.get(Business, business_id) is None:
+        raise click.ClickException(f'Business {business_id} does not exist')
+
+    started = time.perf_counter()
+    with open(path, 'rb') as stream:
+        report = import_records(kind, business_id, stream, detect_format(path, fmt))
+    elapsed = time.perf_counter() - started
+
+    for error in report['errors']:
+        print(f"Line {error['line']}: {error['error']}")
+    print(f"Imported {report['imported']} {kind} ({report['failed']} failed) in {elapsed:.2f}s")
+
+@click.command('bulk-subscriptions')
+@with_appcontext
+@click.argument('operation', type=click.Choice(BULK_OPERATIONS))
+@click.option('--business-id', type=int, required=True, help='Business whose subscriptions to change.')
+@click.option('--plan-id', type=int, help='Only subscriptions on this plan.')
+@click.option('--status', help='Only subscriptions with this status.')
+@click.option('--start-from', type=click.DateTime(['%Y-%m-%d']), help='Only subscriptions starting on or after.')
+@click.option('--start-to', type=click.DateTime(['%Y-%m-%d']), help='Only subscriptions starting on or before.')
+@click.option('--ids-file', type=click.Path(exists=True, dir_okay=False), help='File of subscription IDs, one per line.')
+@click.option('--target-plan-id', type=int, help='Plan to migrate to (migrate).')
+@click.option('--next-billing-date', type=click.DateTime(['%Y-%m-%d']),
+              help='Date to set (reschedule); defaults to each subscription\'s next billing date from today.')
+@click.option('--dry-run', is_flag=True, help='Only count the matching subscriptions.')
+def bulk_subscriptions_command(operation, business_id, plan_id, status, start_from, start_to, ids_file,
+                               target_plan_id, next_billing_date, dry_run):
+    """Cancel, migrate to another plan or reschedule many subscriptions with chunked set-based updates"""
+    subscription_ids = None
+    if ids_file:
+        with open(ids_file) as lines:
+            subscription_ids = [int(line) for line in lines if line.strip()]
+
+    started = time.perf_counter()
+    try:
+        report = bulk_update_subscriptions(
+            business_id, operation, plan_id=plan_id, status=status,
+            start_from=start_from.date() if start_from else None, start_to=start_to.date() if start_to else None,
+            subscription_ids=subscription_ids, target_plan_id=target_plan_id,
+            next_billing_date=next_billing_date.date() if next_billing_date else None, dry_run=dry_run
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - started
+
+    if dry_run:
+        print(f"{report['matched']} subscription(s) would be changed by {operation}")
+    else:
+        print(f"{operation}: updated {report['updated']} subscription(s) in {elapsed:.2f}s")
+
+@click.command('archive-payments')
+@with_appcontext
+@click.option('--months', type=int, help='Calendar months of payments to keep hot (defaults to PAYMENT_HOT_MONTHS).')
+@click.option('--business-id', type=int, help='Only archive this business.')
+@click.option('--dry-run', is_flag=True, help='Only count the payments that would be archived.')
+def archive_payments_command(months, business_id, dry_run):
+    """Move payments older than the hot horizon to the archive tables with per-month summaries"""
+    started = time.perf_counter()
+    try:
+        report = archive_payments(months, business_id=business_id, dry_run=dry_run)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - started
+
+    if dry_run:
+        print(f"{report['payments']} payment(s) dated before {report['horizon']} would be archived")
+    else:
+        print(f"Archived {report['payments']} payment(s) in {report['months']} business month(s) "
+              f"dated before {report['horizon']} in {elapsed:.2f}s")
+
+@click.command('snapshot-metrics')
+@with_appcontext
+@click.option('--date', 'day', type=click.DateTime(['%Y-%m-%d']), help='Day to snapshot (defaults to yesterday).')
+@click.option('--since', type=click.DateTime(['%Y-%m-%d']), help='Backfill every day from this date up to --date.')
+def snapshot_metrics_command(day, since):
+    """Write daily metrics snapshots for every business (run once a day, e.g. from cron)"""
+    day = day.date() if day else date.today() - timedelta(days=1)
+    since = since.date() if since else day
+    if since > day:
+        raise click.ClickException('--since must not be after --date')
+
+    started = time.perf_counter()
+    written = write_snapshots(since, day)
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {written} snapshot(s) for {since} to {day} in {elapsed:.2f}s")
+
+@click.command('analytics')
+@with_appcontext
+@click.argument('report', type=click.Choice(list(ANALYTICS_REPORTS)))
+@click.option('--business-id', type=int, required=True, help='Business to report on.')
+@click.option('--since', type=click.DateTime(['%Y-%m-%d']), help='Only subscriptions started on or after this date.')
+def analytics_command(report, business_id, since):
+    """Print cohort retention or per-plan LTV for a business"""
+    if db.session.get(Business, business_id) is None:
+        raise click.ClickException(f'Business {business_id} does not exist')
+
+    started = time.perf_counter()
+    rows = ANALYTICS_REPORTS[report](business_id, since=since.date() if since else None)
+    elapsed = time.perf_counter() - started
+
+    if report == 'cohorts':
+        for row in rows:
+            retention = ' '.join(f"{rate * 100:5.1f}" for rate in row['retention'])
+            print(f"{row['cohort']} {row['size']:>8} {retention}")
+    else:
+        for row in rows:
+            ltv = f"{row['projected_ltv']:.2f}" if row['projected_ltv'] is not None else '-'
+            print(f"{row['name']:<20} {row['subscriptions']:>8} subs  churn/month {row['monthly_churn_rate']}  "
+                  f"LTV {ltv}  collected/sub {row['revenue_per_subscription']}")
+    print(f"{len(rows)} row(s) in {elapsed * 1000:.0f}ms")
+
+@click.command('bill-all')
+@with_appcontext
+@click.option('--processes', default=os.cpu_count() or 1, show_default=True, help='Worker processes to run.')
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True, help='Subscriptions billed per transaction.')
+def bill_all_command(processes, chunk_size):
+    """Bill every business with due subscriptions across a process pool"""
+    from concurrent.futures import ProcessPoolExecutor
+    from worker import drain_queue
+
+    queued = enqueue_due_businesses()
+    db.session.remove()
+    db.engine.dispose()  # so no pool process inherits this process's open connections
+    print(f"Queued {len(queued)} business billing job(s) across {processes} process(es)")
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        billed = sum(pool.map(drain_queue, [chunk_size] * processes))
+    elapsed = time.perf_counter() - started
+
+    rate = billed / elapsed if elapsed > 0 else 0
+    print(f"Billed {billed} subscriptions in {elapsed:.2f}s ({rate:.0f} subscriptions/sec)")
+
+@click.command('retry-payments')
+@with_appcontext
+@click.option('--batch-size', default=RETRY_BATCH_SIZE, show_default=True, help='Retries per transaction.')
+def retry_payments_command(batch_size):
+    """Retry every declined payment whose backoff has elapsed (the billing worker does this between jobs)"""
+    started = time.perf_counter()
+    totals = {'retried': 0, 'recovered': 0, 'declined': 0, 'canceled': 0}
+    while True:
+        report = retry_due_payments(batch_size=batch_size)
+        if not report['retried']:
+            break
+        for field, value in report.items():
+            totals[field] += value
+    elapsed = time.perf_counter() - started
+    print(f"Retried {totals['retried']} payment(s) in {elapsed:.2f}s: {totals['recovered']} recovered, "
+          f"{totals['declined']} declined again, {totals['canceled']} canceled")
+
+COMMANDS = [
+    upgrade_db_command,
+    rebuild_metrics_command,
+    check_business_ids_command,
+    import_data_command,
+    bulk_subscriptions_command,
+    archive_payments_command,
+    snapshot_metrics_command,
+    analytics_command,
+    bill_all_command,
+    retry_payments_command,
+]
+
+def register_commands(app):
+    for command in COMMANDS:
+        app.cli.add_command(command)
@@ -3,18 +3,74 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def normalize_url(url):
+    """Rewrite a Heroku-style postgres:// URL to the scheme SQLAlchemy expects"""
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def database_url(default):
+    return normalize_url(os.getenv('DATABASE_URL', default))
+
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///smartmanagementhub.db'
+    SQLALCHEMY_DATABASE_URI = database_url('sqlite:///smartmanagementhub.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool per process (each gunicorn worker has its own); used for PostgreSQL
+    DATABASE_POOL_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),  # seconds, below typical server idle timeouts
+        'pool_pre_ping': True
+    }
+    # Applied to every new SQLite connection; set to {} to keep SQLite's defaults
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),  # milliseconds
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # bytes
+    }
+
+    # Read replicas for read_only views (dashboard, list pages, exports, metrics APIs), comma separated
+    SQLALCHEMY_REPLICA_URIS = [normalize_url(url.strip())
+                               for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', '30'))  # skip a failed replica this long
+    REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))  # reads stay on the primary after a write
+
+    TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR')  # compiled Jinja templates, defaults to instance/
+
+    METRICS_CACHE = os.getenv('METRICS_CACHE', 'memory')  # 'memory', 'sqlite' or 'none'
+    METRICS_CACHE_TTL = int(os.getenv('METRICS_CACHE_TTL', '60'))
+    METRICS_CACHE_PATH = os.getenv('METRICS_CACHE_PATH')  # sqlite backend file, defaults to instance/
+
+    # Logged-in business looked up once per TTL per process instead of on every request; 0 disables
+    PRINCIPAL_CACHE_TTL = int(os.getenv('PRINCIPAL_CACHE_TTL', '60'))
+    PRINCIPAL_CACHE_SIZE = int(os.getenv('PRINCIPAL_CACHE_SIZE', '10000'))
+
+    # Charges go through this gateway: 'simulated' (declines PAYMENT_FAILURE_RATE of them) or 'module:ClassName'
+    PAYMENT_GATEWAY = os.getenv('PAYMENT_GATEWAY', 'simulated')
+    PAYMENT_FAILURE_RATE = float(os.getenv('PAYMENT_FAILURE_RATE', '0'))
+
+    # Payments older than this many calendar months (the current one included) move to the archive tables
+    # once a day from the billing worker; 0 disables archiving
+    PAYMENT_HOT_MONTHS = int(os.getenv('PAYMENT_HOT_MONTHS', '12'))
+
+    # Per-route timings served in the Prometheus format from /metrics
+    INSTRUMENTATION = os.getenv('INSTRUMENTATION', '1') != '0'
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # if set, /metrics requires "Authorization: Bearer <token>"
+    METRICS_PUBLIC = os.getenv('METRICS_PUBLIC') == '1'  # without a token, /metrics is 404 unless this is set
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '250'))  # log statements at least this slow; 0 disables
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # fraction of requests to cProfile
+    PROFILE_ALLOW_HEADER = os.getenv('PROFILE_ALLOW_HEADER') == '1'  # profile requests sent with "X-Profile: 1"
+    PROFILE_DIR = os.getenv('PROFILE_DIR')  # .prof files, defaults to instance/profiles
+
 class DevelopmentConfig(Config):
     DEBUG = True
 
 class ProductionConfig(Config):
     DEBUG = False
-    # For production, you might want to use a more robust database
-    # SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///smartmanagementhub.db')
 
 class TestingConfig(Config):
     TESTING = True
@@ -25,4 +81,4 @@ config = {
     'production': ProductionConfig,
     'testing': TestingConfig,
     'default': DevelopmentConfig
-} 
\ No newline at end of file
+} 
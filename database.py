@@ -0,0 +1,53 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from models import db
+from routing import ReplicaSet, remember_writes, DEFAULT_RETRY_SECONDS
+
+def is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+def engine_options(config, uri=None):
+    """Engine options for the configured backend (or uri's): pool tuning everywhere but SQLite"""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if not is_sqlite(uri or config['SQLALCHEMY_DATABASE_URI']):
+        for name, value in (config.get('DATABASE_POOL_OPTIONS') or {}).items():
+            options.setdefault(name, value)
+    return options
+
+def set_sqlite_pragmas(engine, pragmas):
+    """Run PRAGMA statements on every new DBAPI connection of engine"""
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    event.listen(engine, 'connect', apply_pragmas)
+
+def init_database(app):
+    """Bind db to app with backend-specific engine options and SQLite pragmas"""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if pragmas and is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        with app.app_context():
+            set_sqlite_pragmas(db.engine, pragmas)
+    init_replicas(app)
+
+def init_replicas(app):
+    """Create engines for SQLALCHEMY_REPLICA_URIS and route read_only views to them"""
+    uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+    if not uris:
+        app.extensions['replicas'] = None
+        return
+
+    engines = []
+    for uri in uris:
+        engine = create_engine(uri, **engine_options(app.config, uri))
+        pragmas = app.config.get('SQLITE_PRAGMAS')
+        if pragmas and is_sqlite(uri):
+            set_sqlite_pragmas(engine, pragmas)
+        engines.append(engine)
+    app.extensions['replicas'] = ReplicaSet(engines, app.config.get('REPLICA_RETRY_SECONDS', DEFAULT_RETRY_SECONDS))
+    app.after_request(remember_writes)
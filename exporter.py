@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from models import db, Plan, Customer, Subscription, Payment, PaymentArchive
+
+YIELD_PER = 1000  # rows fetched from the server-side cursor at a time
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+def parse_date_arg(value, name):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{name} must be YYYY-MM-DD')
+
+def subscriptions_export_query(business_id, status=None, date_from=None, date_to=None):
+    """Subscriptions with customer and plan details, filtered by status and start_date range"""
+    query = db.select(
+        Subscription.subscription_id,
+        Subscription.customer_id,
+        Customer.full_name.label('customer_name'),
+        Customer.email.label('customer_email'),
+        Subscription.plan_id,
+        Plan.name.label('plan_name'),
+        Subscription.status,
+        Subscription.start_date,
+        Subscription.next_billing_date,
+        Subscription.cancellation_date
+    ).join(Customer, Subscription.customer_id == Customer.customer_id).join(
+        Plan, Subscription.plan_id == Plan.plan_id
+    ).where(Subscription.business_id == business_id)
+
+    if status:
+        query = query.where(Subscription.status == status)
+    if date_from:
+        query = query.where(Subscription.start_date >= date_from)
+    if date_to:
+        query = query.where(Subscription.start_date <= date_to)
+    return query.order_by(Subscription.subscription_id)
+
+def payments_export_query(business_id, status=None, date_from=None, date_to=None):
+    """Payment ledger rows, hot and archived, filtered by status and payment_date range (inclusive days)"""
+    selects = []
+    for payments in (Payment, PaymentArchive):
+        query = db.select(
+            payments.payment_id,
+            payments.subscription_id,
+            payments.amount,
+            payments.payment_date,
+            payments.status
+        ).where(payments.business_id == business_id)
+
+        if status:
+            query = query.where(payments.status == status)
+        if date_from:
+            query = query.where(payments.payment_date >= datetime.combine(date_from, datetime.min.time()))
+        if date_to:
+            query = query.where(payments.payment_date < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+        selects.append(query)
+
+    ledger = db.union_all(*selects)
+    return ledger.order_by(ledger.selected_columns.payment_date, ledger.selected_columns.payment_id)
+
+def export_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def stream_export(query, fmt='csv'):
+    """Yield the export as text chunks, one chunk per fetched partition
+
+    The header (for CSV) is sent before the first row is fetched so the
+    response starts immediately; memory stays at one partition of rows.
+    """
+    result = db.session.execute(query.execution_options(yield_per=YIELD_PER))
+    columns = list(result.keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if fmt == 'csv':
+        writer.writerow(columns)
+        yield buffer.getvalue()
+
+    for partition in result.partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        for row in partition:
+            values = [export_value(value) for value in row]
+            if fmt == 'csv':
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, values))) + '\n')
+        yield buffer.getvalue()
+    result.close()
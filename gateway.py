@@ -0,0 +1,47 @@
+import random
+from flask import current_app, has_app_context
+from werkzeug.utils import import_string
+
+class PaymentGateway:
+    """Charges subscriptions for billing and retries
+
+    Subclasses implement charge(); configure one with PAYMENT_GATEWAY set to
+    'module:ClassName'. The class is built with the app config, once per app.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or {}
+
+    def charge(self, charges):
+        """Attempt each (subscription_id, amount) charge and return one bool per charge, True when paid"""
+        raise NotImplementedError
+
+class SimulatedGateway(PaymentGateway):
+    """Local stand-in that declines a PAYMENT_FAILURE_RATE fraction of charges at random"""
+
+    def __init__(self, config=None, failure_rate=None, seed=None):
+        super().__init__(config)
+        if failure_rate is None:
+            failure_rate = float(self.config.get('PAYMENT_FAILURE_RATE', 0))
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+    def charge(self, charges):
+        if not self.failure_rate:
+            return [True] * len(charges)
+        return [self.random.random() >= self.failure_rate for _ in charges]
+
+def create_gateway(app):
+    """Build the gateway selected by the PAYMENT_GATEWAY setting ('simulated' or 'module:ClassName')"""
+    name = app.config.get('PAYMENT_GATEWAY', 'simulated')
+    gateway_class = SimulatedGateway if name == 'simulated' else import_string(name)
+    return gateway_class(app.config)
+
+def init_gateway(app):
+    app.extensions['payment_gateway'] = create_gateway(app)
+
+def get_gateway():
+    """The app's gateway; outside an app every charge succeeds"""
+    if not has_app_context():
+        return SimulatedGateway()
+    return current_app.extensions.get('payment_gateway') or SimulatedGateway()
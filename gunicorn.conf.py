@@ -0,0 +1,29 @@
+"""
+Gunicorn settings, read automatically by `gunicorn 'app:create_app()'`
+The default gthread workers serve THREADS requests per process, so API
+polling blocked on the database no longer ties up a whole worker. Set
+GUNICORN_WORKER_CLASS=gevent (pip install gevent, plus psycogreen on
+PostgreSQL) for thousands of mostly idle connections per node.
+"""
+
+import multiprocessing
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))  # gthread only
+# Open connections per worker (gthread and gevent). gthread stops serving once it holds
+# this many idle connections, so keep it well above the expected per-worker concurrency
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '4096'))
+backlog = int(os.getenv('GUNICORN_BACKLOG', '2048'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            return  # SQLite, or psycopg2 left blocking
+        # Let other greenlets run while a PostgreSQL query waits
+        patch_psycopg()
@@ -0,0 +1,210 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from models import db, Plan, Customer, Subscription
+from billing import billing_interval_days
+from metrics import rebuild_business_metrics
+from cache import mark_business_dirty
+from listing import SUBSCRIPTION_STATUSES
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100  # keep the error report bounded on very dirty files
+
+IMPORT_KINDS = ['customers', 'plans', 'subscriptions']
+BILLING_INTERVALS = ['monthly', 'yearly']
+
+def read_rows(stream, fmt):
+    """Yield (line_number, row dict) from a binary CSV or NDJSON stream without reading it all"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, e
+                continue
+            yield line_number, row if isinstance(row, dict) else ValueError('expected a JSON object')
+
+def detect_format(filename=None, fmt=None):
+    """Pick 'csv' or 'ndjson' from an explicit format or the file extension"""
+    if fmt:
+        fmt = fmt.lower()
+    elif filename and filename.lower().endswith(('.ndjson', '.jsonl', '.json')):
+        fmt = 'ndjson'
+    else:
+        fmt = 'csv'
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError('format must be csv or ndjson')
+    return fmt
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def required(row, field):
+    value = row.get(field)
+    if value is None or str(value).strip() == '':
+        raise ValueError(f'{field} is required')
+    return str(value).strip()
+
+def parse_date(row, field, default=None):
+    value = row.get(field)
+    if value is None or str(value).strip() == '':
+        if default is not None:
+            return default
+        raise ValueError(f'{field} is required')
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{field} must be YYYY-MM-DD')
+
+# Row validation
+def customer_record(business_id, row, lookups):
+    return {
+        'business_id': business_id,
+        'full_name': required(row, 'full_name'),
+        'email': required(row, 'email')
+    }
+
+def plan_record(business_id, row, lookups):
+    try:
+        price = Decimal(required(row, 'price'))
+    except InvalidOperation:
+        raise ValueError('price must be a number')
+    billing_interval = required(row, 'billing_interval')
+    if billing_interval not in BILLING_INTERVALS:
+        raise ValueError(f'billing_interval must be one of {", ".join(BILLING_INTERVALS)}')
+    return {
+        'business_id': business_id,
+        'name': required(row, 'name'),
+        'price': price,
+        'billing_interval': billing_interval
+    }
+
+def subscription_record(business_id, row, lookups):
+    customers, plans = lookups
+    if row.get('customer_id'):
+        customer_id = customers['ids'].get(int(row['customer_id']))
+    else:
+        customer_id = customers['emails'].get(required(row, 'customer_email'))
+    if customer_id is None:
+        raise ValueError('customer not found')
+
+    if row.get('plan_id'):
+        plan = plans['ids'].get(int(row['plan_id']))
+    else:
+        plan = plans['names'].get(required(row, 'plan_name'))
+    if plan is None:
+        raise ValueError('plan not found')
+
+    status = str(row.get('status') or 'active').strip()
+    if status not in SUBSCRIPTION_STATUSES:
+        raise ValueError(f'status must be one of {", ".join(SUBSCRIPTION_STATUSES)}')
+    start_date = parse_date(row, 'start_date')
+    next_billing_date = parse_date(row, 'next_billing_date',
+                                   start_date + timedelta(days=billing_interval_days(plan.billing_interval)))
+    cancellation_date = parse_date(row, 'cancellation_date') if row.get('cancellation_date') else None
+
+    return {
+        'business_id': business_id,
+        'customer_id': customer_id,
+        'plan_id': plan.plan_id,
+        'status': status,
+        'start_date': start_date,
+        'next_billing_date': next_billing_date,
+        'cancellation_date': cancellation_date
+    }
+
+# Reference lookups, built once per batch
+def subscription_lookups(business_id, rows, plans):
+    """Resolve every customer referenced by a batch with one query; plans are loaded once per import"""
+    # Stripped, as subscription_record looks them up through required()
+    emails = {str(row['customer_email']).strip() for _, row in rows
+              if isinstance(row, dict) and row.get('customer_email')}
+    ids = set()
+    for _, row in rows:
+        if isinstance(row, dict) and row.get('customer_id'):
+            try:
+                ids.add(int(row['customer_id']))
+            except (TypeError, ValueError):
+                pass
+
+    customers = {'emails': {}, 'ids': {}}
+    if emails:
+        for customer_id, email in db.session.query(Customer.customer_id, Customer.email).filter(
+            Customer.business_id == business_id, Customer.email.in_(emails)
+        ):
+            # Oldest customer wins on duplicate emails
+            customers['emails'][email] = min(customer_id, customers['emails'].get(email, customer_id))
+    if ids:
+        for (customer_id,) in db.session.query(Customer.customer_id).filter(
+            Customer.business_id == business_id, Customer.customer_id.in_(ids)
+        ):
+            customers['ids'][customer_id] = customer_id
+    return customers, plans
+
+def load_plans(business_id):
+    plans = Plan.query.filter_by(business_id=business_id).all()
+    return {
+        'ids': {plan.plan_id: plan for plan in plans},
+        'names': {plan.name: plan for plan in plans}
+    }
+
+IMPORTERS = {
+    'customers': (Customer, customer_record),
+    'plans': (Plan, plan_record),
+    'subscriptions': (Subscription, subscription_record),
+}
+
+def import_records(kind, business_id, stream, fmt='csv', batch_size=BATCH_SIZE):
+    """Stream rows from a CSV/NDJSON file into kind for a business
+
+    Rows are validated and inserted with one executemany per batch, and each
+    batch is committed on its own. Invalid rows are skipped and reported by
+    line number. The metrics rollup is rebuilt once at the end, or when a
+    batch raises, as soon as any subscriptions were committed. Returns a
+    report dict.
+    """
+    model, to_record = IMPORTERS[kind]
+    plans = load_plans(business_id) if kind == 'subscriptions' else None
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+
+    try:
+        for rows in batched(read_rows(stream, fmt), batch_size):
+            lookups = subscription_lookups(business_id, rows, plans) if kind == 'subscriptions' else None
+            records = []
+            for line_number, row in rows:
+                try:
+                    if isinstance(row, Exception):
+                        raise row
+                    records.append(to_record(business_id, row, lookups))
+                except (ValueError, TypeError) as e:
+                    report['failed'] += 1
+                    if len(report['errors']) < MAX_REPORTED_ERRORS:
+                        report['errors'].append({'line': line_number, 'error': str(e)})
+
+            if records:
+                db.session.execute(db.insert(model), records)
+                mark_business_dirty(db.session, business_id)  # bulk inserts skip the flush hooks
+                db.session.commit()
+                report['imported'] += len(records)
+    finally:
+        if kind == 'subscriptions' and report['imported']:
+            # Also when a later batch failed: the batches committed before it are in the tables
+            db.session.rollback()
+            rebuild_business_metrics(business_id)
+            db.session.commit()
+    return report
@@ -1,25 +1,24 @@
 #!/usr/bin/env python3
 """
 Database initialization script for Smart Management Hub
-Run this script to create all database tables
+Run this script (or `flask --app app upgrade-db`) once per deploy to create
+all database tables, or to upgrade an existing database with any tables,
+columns and indexes added since it was created; the app itself never does
 """
 
-from app import app, db
-from models import Business, Plan, Customer, Subscription, Payment
+from app import create_app
+from migrations import upgrade_database
 
 def init_database():
-    """Initialize the database with all tables"""
-    with app.app_context():
-        # Create all tables
-        db.create_all()
-        print("✅ Database tables created successfully!")
-        print("📊 Tables created:")
-        print("   - businesses")
-        print("   - plans") 
-        print("   - customers")
-        print("   - subscriptions")
-        print("   - payments")
+    """Initialize or upgrade the database to the current models"""
+    with create_app().app_context():
+        changes = upgrade_database()
+        print("✅ Database is up to date!")
+        if changes:
+            print("📊 Changes applied:")
+            for change in changes:
+                print(f"   - {change}")
         print("\n🚀 Your Smart Management Hub is ready to use!")
 
 if __name__ == "__main__":
-    init_database() 
\ No newline at end of file
+    init_database()
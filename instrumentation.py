@@ -0,0 +1,292 @@
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from flask import Response, abort, before_render_template, current_app, g, has_request_context, request, \
+    template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine.cursor import CursorFetchStrategy
+from cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+PROFILE_HEADER = 'X-Profile'
+
+class RequestSample:
+    """What one request spent, filled in by the hooks below while it runs"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.status = 500  # unless after_request sees a response
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_starts = []
+        self.rows = 0
+        self.profiler = None
+
+class RouteStats:
+    """Totals for one (endpoint, method) pair"""
+
+    def __init__(self):
+        self.statuses = {}
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rows = 0
+
+    def add(self, sample, seconds):
+        self.statuses[sample.status] = self.statuses.get(sample.status, 0) + 1
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.seconds += seconds
+        self.sql_statements += sample.sql_statements
+        self.sql_seconds += sample.sql_seconds
+        self.template_seconds += sample.template_seconds
+        self.rows += sample.rows
+
+class Instrumentation:
+    """Per-process request statistics, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.routes = {}
+        self.slow_queries = 0
+        self.profiles = 0
+        self._lock = threading.Lock()
+
+    def count(self, counter):
+        """Add one to a process-wide counter (slow_queries or profiles)"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def record(self, endpoint, method, sample, seconds):
+        with self._lock:
+            stats = self.routes.get((endpoint, method))
+            if stats is None:
+                stats = self.routes[(endpoint, method)] = RouteStats()
+            stats.add(sample, seconds)
+
+    def render(self):
+        worker = str(os.getpid())
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                labels = dict(labels, worker=worker)
+                label_text = ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items())
+                lines.append(f'{name}{suffix}{{{label_text}}} {format_value(value)}')
+
+        with self._lock:
+            routes = sorted(self.routes.items())
+            metric('smh_http_requests_total', 'counter', 'Requests handled, by route and status code', [
+                ('', {'endpoint': endpoint, 'method': method, 'status': status}, count)
+                for (endpoint, method), stats in routes for status, count in sorted(stats.statuses.items())
+            ])
+
+            histogram = []
+            for (endpoint, method), stats in routes:
+                labels = {'endpoint': endpoint, 'method': method}
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                    cumulative += count
+                    histogram.append(('_bucket', dict(labels, le=format_value(bound)), cumulative))
+                histogram.append(('_bucket', dict(labels, le='+Inf'), stats.count))
+                histogram.append(('_sum', labels, stats.seconds))
+                histogram.append(('_count', labels, stats.count))
+            metric('smh_http_request_duration_seconds', 'histogram', 'Wall time from request start to teardown',
+                   histogram)
+
+            for name, attribute, help_text in (
+                ('smh_sql_statements_total', 'sql_statements', 'SQL statements executed while handling requests'),
+                ('smh_sql_seconds_total', 'sql_seconds', 'Time spent executing SQL while handling requests'),
+                ('smh_template_render_seconds_total', 'template_seconds', 'Time spent rendering templates'),
+                ('smh_rows_loaded_total', 'rows', 'Rows fetched from SELECT results'),
+            ):
+                metric(name, 'counter', help_text, [
+                    ('', {'endpoint': endpoint, 'method': method}, getattr(stats, attribute))
+                    for (endpoint, method), stats in routes
+                ])
+
+            metric('smh_slow_queries_total', 'counter', 'SQL statements slower than SLOW_QUERY_MS',
+                   [('', {}, self.slow_queries)])
+            metric('smh_profiles_captured_total', 'counter', 'Requests profiled with cProfile',
+                   [('', {}, self.profiles)])
+
+        cache = get_cache()
+        if cache is not None:
+            stats = cache.stats
+            for name, value in (('hits', stats.hits), ('misses', stats.misses),
+                                ('invalidations', stats.invalidations)):
+                metric(f'smh_metrics_cache_{name}_total', 'counter', f'Metrics cache {name}', [('', {}, value)])
+        return '\n'.join(lines) + '\n'
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def current_sample():
+    if not has_request_context():
+        return None
+    return g.get('instrumentation_sample')
+
+# Request hooks
+def start_request():
+    sample = g.instrumentation_sample = RequestSample()
+    config = current_app.config
+    wanted = random.random() < config.get('PROFILE_SAMPLE_RATE', 0) or (
+        config.get('PROFILE_ALLOW_HEADER') and request.headers.get(PROFILE_HEADER) == '1')
+    if wanted:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # another profiler is active in this process (Python 3.12+)
+        sample.profiler = profiler
+
+def record_status(response):
+    sample = current_sample()
+    if sample is not None:
+        sample.status = response.status_code
+    return response
+
+def finish_request(exc=None):
+    sample = g.pop('instrumentation_sample', None)
+    if sample is None:
+        return
+    seconds = time.perf_counter() - sample.started
+    instrumentation = current_app.extensions['instrumentation']
+    if sample.profiler is not None:
+        sample.profiler.disable()
+        save_profile(sample.profiler, instrumentation)
+    instrumentation.record(request.endpoint or 'unmatched', request.method, sample, seconds)
+
+def save_profile(profiler, instrumentation):
+    """Dump the request's profile as a pstats file (open with `python -m pstats` or snakeviz)"""
+    directory = current_app.config.get('PROFILE_DIR') or os.path.join(current_app.instance_path, 'profiles')
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{time.time_ns() // 1000000}-{os.getpid()}-"
+                                       f"{(request.endpoint or 'unmatched').replace('.', '-')}.prof")
+        profiler.dump_stats(path)
+    except OSError as e:
+        logger.warning("Could not save profile: %s", e)
+        return
+    instrumentation.count('profiles')
+    logger.info("Profiled %s %s -> %s", request.method, request.path, path)
+
+# Template timing
+def template_started(sender, template, context, **extra):
+    sample = current_sample()
+    if sample is not None:
+        sample.template_starts.append(time.perf_counter())
+
+def template_finished(sender, template, context, **extra):
+    sample = current_sample()
+    if sample is not None and sample.template_starts:
+        sample.template_seconds += time.perf_counter() - sample.template_starts.pop()
+
+# SQL timing
+def register_sql_timing(engine, instrumentation, slow_query_ms):
+    """Count and time every statement on engine, logging those slower than slow_query_ms"""
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('statement_starts', []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['statement_starts'].pop()
+        sample = current_sample()
+        if sample is not None:
+            sample.sql_statements += 1
+            sample.sql_seconds += seconds
+            count_fetched_rows(context, sample)
+        if slow_query_ms and seconds * 1000 >= slow_query_ms:
+            instrumentation.count('slow_queries')
+            logger.warning("Slow query (%.1fms)%s: %s", seconds * 1000,
+                           f" in {request.endpoint}" if has_request_context() else '', ' '.join(statement.split()))
+
+    def discard_start(context):
+        starts = context.connection.info.get('statement_starts') if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', discard_start)
+
+class CountingFetchStrategy(CursorFetchStrategy):
+    """The default fetch strategy, adding the rows each fetch returns to the request's sample"""
+
+    __slots__ = ('sample',)
+
+    def __init__(self, sample):
+        self.sample = sample
+
+    def fetchone(self, result, dbapi_cursor, hard_close=False):
+        row = super().fetchone(result, dbapi_cursor, hard_close)
+        if row is not None:
+            self.sample.rows += 1
+        return row
+
+    def fetchmany(self, result, dbapi_cursor, size=None):
+        rows = super().fetchmany(result, dbapi_cursor, size)
+        self.sample.rows += len(rows)
+        return rows
+
+    def fetchall(self, result, dbapi_cursor):
+        rows = super().fetchall(result, dbapi_cursor)
+        self.sample.rows += len(rows)
+        return rows
+
+def count_fetched_rows(context, sample):
+    """Count the rows a select's result hands out as the caller fetches them, without buffering them again
+
+    Streamed results keep their buffered strategy and are not counted.
+    """
+    if (context is None or cursor_description(context) is None or context.execution_options.get('stream_results')
+            or type(context.cursor_fetch_strategy) is not CursorFetchStrategy):
+        return
+    context.cursor_fetch_strategy = CountingFetchStrategy(sample)
+
+def cursor_description(context):
+    return context.cursor.description if context.cursor is not None else None
+
+# Prometheus endpoint
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        if not current_app.config.get('METRICS_PUBLIC'):
+            abort(404)
+    elif request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return Response(current_app.extensions['instrumentation'].render(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def init_instrumentation(app, db):
+    """Record per-route timings for app and serve them from /metrics (unless INSTRUMENTATION is off)"""
+    if not app.config.get('INSTRUMENTATION', True):
+        return
+    instrumentation = app.extensions['instrumentation'] = Instrumentation()
+
+    app.before_request(start_request)
+    app.after_request(record_status)
+    app.teardown_request(finish_request)
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    replicas = app.extensions.get('replicas')
+    with app.app_context():
+        for engine in [db.engine] + (replicas.engines if replicas is not None else []):
+            register_sql_timing(engine, instrumentation, app.config.get('SLOW_QUERY_MS', 0))
@@ -0,0 +1,181 @@
+import time
+from datetime import date, datetime, timedelta
+from models import db, Subscription, BillingJob
+from snapshots import snapshot_if_due
+from archive import archive_if_due
+from billing import run_billing, retry_due_payments, count_due_subscriptions, CHUNK_SIZE
+
+POLL_INTERVAL = 2  # seconds between queue polls when idle
+LEASE_SECONDS = 300  # a running job without a heartbeat for this long is reclaimed
+
+class LeaseLost(Exception):
+    """Another worker reclaimed the job this worker was running"""
+
+def enqueue_billing_job(business_id):
+    """Queue a billing run for a business, reusing one that is already pending"""
+    job = BillingJob.query.filter(
+        BillingJob.business_id == business_id,
+        BillingJob.status.in_(['queued', 'running'])
+    ).order_by(BillingJob.job_id).first()
+    if job:
+        return job
+
+    job = BillingJob(business_id=business_id, status='queued')
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def enqueue_due_businesses(today=None):
+    """Queue a billing job for every business with subscriptions due, returning the jobs"""
+    today = today or date.today()
+    business_ids = db.session.query(Subscription.business_id).filter(
+        Subscription.status == 'active',
+        Subscription.next_billing_date <= today
+    ).distinct().order_by(Subscription.business_id).all()
+    return [enqueue_billing_job(business_id) for (business_id,) in business_ids]
+
+def claim_next_job():
+    """Atomically claim the oldest queued job, or a running one whose lease expired
+
+    The claim is a conditional UPDATE on the status/heartbeat the worker just
+    read, so only one worker can win it even across processes.
+    """
+    while True:
+        stale_before = datetime.utcnow() - timedelta(seconds=LEASE_SECONDS)
+        candidate = db.session.query(BillingJob.job_id, BillingJob.status, BillingJob.heartbeat_at).filter(
+            (BillingJob.status == 'queued') |
+            ((BillingJob.status == 'running') & (BillingJob.heartbeat_at < stale_before))
+        ).order_by(BillingJob.job_id).first()
+        if candidate is None:
+            db.session.commit()
+            return None
+
+        now = datetime.utcnow()
+        values = {'status': 'running', 'heartbeat_at': now}
+        if candidate.status == 'queued':
+            values['started_at'] = now
+        claimed = db.session.execute(
+            db.update(BillingJob).where(
+                BillingJob.job_id == candidate.job_id,
+                BillingJob.status == candidate.status,
+                BillingJob.heartbeat_at.is_(None) if candidate.heartbeat_at is None
+                else BillingJob.heartbeat_at == candidate.heartbeat_at
+            ).values(values).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(BillingJob, candidate.job_id)
+
+def run_job(job, chunk_size=CHUNK_SIZE):
+    """Run a claimed billing job, resuming from its cursor if it was reclaimed
+
+    The cursor, processed count and heartbeat are written in the same
+    transaction as each chunk of payments, so a job picked up after a crash
+    never bills a subscription twice. Each chunk first renews the lease
+    with an UPDATE conditional on the heartbeat this worker last wrote;
+    when another worker has reclaimed the job in the meantime, the chunk
+    is rolled back before anything is charged and the job is left to it.
+    Returns the number of subscriptions this worker billed.
+    """
+    heartbeat_at = job.heartbeat_at
+    billed = 0
+
+    def renew_lease():
+        nonlocal heartbeat_at
+        now = datetime.utcnow()
+        renewed = db.session.execute(
+            db.update(BillingJob).where(
+                BillingJob.job_id == job.job_id,
+                BillingJob.heartbeat_at == heartbeat_at
+            ).values(heartbeat_at=now).execution_options(synchronize_session=False)
+        ).rowcount
+        if not renewed:
+            raise LeaseLost(f'billing job {job.job_id} was reclaimed by another worker')
+        heartbeat_at = now
+
+    try:
+        if job.run_date is None:
+            job.run_date = date.today()
+        if job.total_count is None:
+            job.total_count = count_due_subscriptions(job.business_id, job.run_date)
+        db.session.commit()
+
+        already_processed = job.processed_count or 0
+
+        def update_progress(processed_count, last_id):
+            nonlocal billed
+            billed = processed_count
+            job.processed_count = already_processed + processed_count
+            job.cursor_id = last_id
+
+        run_billing(job.business_id, today=job.run_date, chunk_size=chunk_size,
+                    progress=update_progress, after_id=job.cursor_id or 0, claim=renew_lease)
+        job.status = 'completed'
+    except LeaseLost as e:
+        db.session.rollback()
+        print(f"Billing job {job.job_id} stopped: {e}")
+        return billed
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.error = str(e)
+        print(f"Billing job {job.job_id} error: {e}")
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return billed
+
+def job_progress(job):
+    """Return a JSON-ready progress report with processing rate and ETA"""
+    rate = None
+    eta_seconds = None
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+        if elapsed > 0 and job.processed_count:
+            rate = job.processed_count / elapsed
+            if job.status == 'running' and job.total_count is not None:
+                eta_seconds = max(job.total_count - job.processed_count, 0) / rate
+
+    return {
+        'job_id': job.job_id,
+        'status': job.status,
+        'processed': job.processed_count,
+        'total': job.total_count,
+        'rate_per_second': round(rate, 2) if rate is not None else None,
+        'eta_seconds': round(eta_seconds, 1) if eta_seconds is not None else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.error
+    }
+
+def run_worker(poll_interval=POLL_INTERVAL, once=False, chunk_size=CHUNK_SIZE):
+    """Process queued billing jobs until interrupted (or the queue and due retries are drained if once)
+
+    Between jobs the worker retries one batch of declined payments, so
+    neither a retry storm nor a long billing queue holds up the other.
+    While idle it also writes yesterday's metrics snapshots if no process
+    has yet, and archives payments that crossed the hot horizon. Returns
+    the number of subscriptions this worker billed.
+    """
+    billed = 0
+    while True:
+        job = claim_next_job()
+        if job:
+            print(f"Running billing job {job.job_id} for business {job.business_id}")
+            billed += run_job(job, chunk_size)
+            print(f"Billing job {job.job_id} {job.status}: {job.processed_count} subscriptions")
+        retried = retry_due_payments()
+        if retried['retried']:
+            print(f"Retried {retried['retried']} payment(s): {retried['recovered']} recovered, "
+                  f"{retried['declined']} declined, {retried['canceled']} canceled")
+        if job or retried['retried']:
+            continue
+        if once:
+            return billed
+        written = snapshot_if_due()
+        if written:
+            print(f"Wrote {written} metrics snapshot(s)")
+        archived = archive_if_due()
+        if archived:
+            print(f"Archived {archived} payment(s)")
+        time.sleep(poll_interval)
@@ -0,0 +1,110 @@
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import func
+from models import Customer, Subscription
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# sort name -> (SQL expression, parser for the cursor value)
+CUSTOMER_SORTS = {
+    'name': (func.lower(Customer.full_name), str),
+    'email': (func.lower(Customer.email), str),
+    'joined': (Customer.created_at, datetime.fromisoformat),
+}
+
+SUBSCRIPTION_SORTS = {
+    'start_date': (Subscription.start_date, date.fromisoformat),
+    'next_billing_date': (Subscription.next_billing_date, date.fromisoformat),
+}
+
+SUBSCRIPTION_STATUSES = ['active', 'canceled', 'past_due', 'trial']
+
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, (date, datetime)):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, parse=None):
+    """Decode a cursor into (sort_value, row_id); raises ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if sort_value is not None and parse:
+            sort_value = parse(sort_value)
+        return sort_value, int(row_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+def page_size(value):
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+def prefix_range(expression, term):
+    """Case-insensitive prefix match written as a range so B-tree indexes on lower(column) apply"""
+    term = term.lower()
+    return (expression >= term) & (expression < term + '\uffff')
+
+def keyset_page(query, id_column, sort=None, sorts=None, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """Fetch one keyset page of query ordered by (sort expression, id_column)
+
+    Returns (rows, next_cursor). Each row has the sort key appended as its
+    last element so cursors are built from the value the database compared,
+    not one recomputed in Python. next_cursor is None on the last page.
+    """
+    expression, parse = (sorts or {}).get(sort, (None, None))
+    if expression is None:
+        expression = id_column
+        order = [id_column]
+    else:
+        order = [expression, id_column]
+    query = query.add_columns(expression.label('sort_key'), id_column.label('row_id'))
+
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, parse)
+        after = (lambda column, value: column < value) if descending else (lambda column, value: column > value)
+        if len(order) == 1:
+            query = query.filter(after(id_column, row_id))
+        else:
+            # Spelled out rather than a row-value comparison, with the redundant bound
+            # first, so SQLite seeks an index ending in (expression, id_column)
+            query = query.filter(
+                expression <= sort_value if descending else expression >= sort_value,
+                after(expression, sort_value) | ((expression == sort_value) & after(id_column, row_id))
+            )
+
+    query = query.order_by(*[column.desc() if descending else column for column in order])
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].sort_key, rows[-1].row_id)
+    return [tuple(row)[:-2] for row in rows], next_cursor
+
+def list_customers(query, search=None, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """Apply search and keyset pagination to a customer query"""
+    if search:
+        query = query.filter(
+            prefix_range(func.lower(Customer.full_name), search) |
+            prefix_range(func.lower(Customer.email), search)
+        )
+    return keyset_page(query, Customer.customer_id, sort, CUSTOMER_SORTS, cursor, limit, descending)
+
+def list_subscriptions(query, business_id, search=None, status=None, sort=None, cursor=None,
+                       limit=DEFAULT_PAGE_SIZE, descending=False):
+    """Apply customer search, status filter and keyset pagination to a subscription query"""
+    if status:
+        query = query.filter(Subscription.status == status)
+    if search:
+        matching_customers = Customer.query.with_entities(Customer.customer_id).filter(
+            Customer.business_id == business_id,
+            prefix_range(func.lower(Customer.full_name), search) |
+            prefix_range(func.lower(Customer.email), search)
+        )
+        query = query.filter(Subscription.customer_id.in_(matching_customers))
+    return keyset_page(query, Subscription.subscription_id, sort, SUBSCRIPTION_SORTS, cursor, limit, descending)
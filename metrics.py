@@ -0,0 +1,218 @@
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import func, case
+from sqlalchemy.exc import IntegrityError
+from models import db, Plan, Subscription, Payment, PaymentSummary, BusinessMetrics
+from cache import get_cache, metrics_key, mark_business_dirty
+from versions import request_version
+
+def aggregate_business_totals(business_id, today=None):
+    """Aggregate the raw rollup values for a business from the live tables"""
+    today = today or date.today()
+    current_month = today.replace(day=1)
+    is_active = Subscription.status == 'active'
+
+    row = db.session.query(
+        func.count(case((is_active, 1))),
+        func.sum(case(((is_active) & (Plan.billing_interval == 'monthly'), Plan.price), else_=0)),
+        func.sum(case(((is_active) & (Plan.billing_interval != 'monthly'), Plan.price), else_=0)),
+        func.count(case((Subscription.cancellation_date >= current_month, 1))),
+        func.count(Subscription.subscription_id)
+    ).select_from(Subscription).join(Plan).filter(
+        Subscription.business_id == business_id
+    ).group_by(Subscription.business_id).first()
+
+    active, monthly_total, yearly_total, canceled, total = row or (0, 0, 0, 0, 0)
+    return {
+        'active_subscribers': active or 0,
+        'monthly_price_total': Decimal(monthly_total or 0),
+        'yearly_price_total': Decimal(yearly_total or 0),
+        'canceled_this_month': canceled or 0,
+        'canceled_month': current_month,
+        'total_subscribers_ever': total or 0
+    }
+
+def compute_business_metrics(business_id, today=None):
+    """Compute dashboard metrics for a business with a single grouped aggregate"""
+    totals = aggregate_business_totals(business_id, today)
+    return build_metrics(totals['active_subscribers'], totals['monthly_price_total'],
+                         totals['yearly_price_total'], totals['canceled_this_month'],
+                         totals['total_subscribers_ever'])
+
+def build_metrics(active_subscribers, monthly_total, yearly_total, canceled_this_month, total_subscribers_ever):
+    """Turn raw aggregate values into the metrics dict used by the dashboard and API"""
+    mrr = Decimal(monthly_total or 0) + Decimal(yearly_total or 0) / 12
+    churn_rate = (canceled_this_month / total_subscribers_ever * 100) if total_subscribers_ever > 0 else 0
+
+    return {
+        'mrr': mrr,
+        'active_subscribers': active_subscribers or 0,
+        'canceled_this_month': canceled_this_month or 0,
+        'total_subscribers_ever': total_subscribers_ever or 0,
+        'churn_rate': round(churn_rate, 2)
+    }
+
+def cached_business_metrics(business_id):
+    """Return dashboard metrics from the metrics cache, falling back to the rollup row
+
+    Entries carry the tenant version read before the metrics were computed,
+    and one from an older version is a miss: commits in other processes
+    bump the version but cannot invalidate this process's cache, and an
+    ETag for the new version must never describe the old numbers.
+    """
+    cache = get_cache()
+    if cache is None:
+        return get_business_metrics(business_id)
+
+    version, _ = request_version(business_id)
+    cached = cache.get(metrics_key(business_id))
+    if cached is not None and cached.get('version') == version:
+        metrics = dict(cached, mrr=Decimal(cached['mrr']))
+        del metrics['version']
+        return metrics
+
+    metrics = get_business_metrics(business_id)
+    cache.set(metrics_key(business_id), dict(metrics, mrr=str(metrics['mrr']), version=version))
+    return metrics
+
+# Materialized rollup
+def get_business_metrics(business_id, today=None):
+    """Read dashboard metrics from the business_metrics rollup row"""
+    current_month = (today or date.today()).replace(day=1)
+    rollup = db.session.get(BusinessMetrics, business_id)
+    if rollup is None:
+        dirty = db.session.info.get('dirty_businesses', ())
+        pending_change = business_id in dirty
+        # Aggregate on the primary: a read_only request would otherwise build the row from a lagging replica
+        db.session.info['wrote'] = True
+        try:
+            rollup = rebuild_business_metrics(business_id, today)
+            if not pending_change:
+                # Building the missing row changes no data, so keep the tenant's version (and ETags)
+                db.session.info['dirty_businesses'].discard(business_id)
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request built the row first; use theirs
+            db.session.rollback()
+            rollup = db.session.get(BusinessMetrics, business_id)
+
+    # The cancellation counter resets lazily once its month has passed
+    canceled = rollup.canceled_this_month if rollup.canceled_month == current_month else 0
+    return build_metrics(rollup.active_subscribers, rollup.monthly_price_total,
+                         rollup.yearly_price_total, canceled, rollup.total_subscribers_ever)
+
+def rebuild_business_metrics(business_id, today=None):
+    """Recompute a business's rollup row from the live tables (caller commits)
+
+    Revenue adds the hot payments to the monthly summaries of archived ones.
+    """
+    totals = aggregate_business_totals(business_id, today)
+    totals['revenue_collected'] = Decimal(db.session.query(
+        func.coalesce(func.sum(Payment.amount), 0)
+    ).filter(
+        Payment.business_id == business_id,
+        Payment.status == 'paid'
+    ).scalar() or 0) + Decimal(db.session.query(
+        func.coalesce(func.sum(PaymentSummary.paid_amount), 0)
+    ).filter(PaymentSummary.business_id == business_id).scalar() or 0)
+
+    rollup = db.session.get(BusinessMetrics, business_id)
+    if rollup is None:
+        rollup = BusinessMetrics(business_id=business_id)
+        db.session.add(rollup)
+    mark_business_dirty(db.session, business_id)
+    for field, value in totals.items():
+        setattr(rollup, field, value)
+    db.session.flush()
+    return rollup
+
+def reconcile_business_metrics(business_id, today=None):
+    """Compare a business's rollup row with the live tables and return any drift"""
+    rollup = db.session.get(BusinessMetrics, business_id)
+    current_month = (today or date.today()).replace(day=1)
+    live = aggregate_business_totals(business_id, today)
+    if rollup is None:
+        return {field: (None, value) for field, value in live.items() if field != 'canceled_month'}
+
+    stored = {
+        'active_subscribers': rollup.active_subscribers,
+        'monthly_price_total': Decimal(rollup.monthly_price_total),
+        'yearly_price_total': Decimal(rollup.yearly_price_total),
+        'canceled_this_month': rollup.canceled_this_month if rollup.canceled_month == current_month else 0,
+        'total_subscribers_ever': rollup.total_subscribers_ever
+    }
+    return {field: (value, live[field]) for field, value in stored.items() if value != live[field]}
+
+def apply_metrics_delta(business_id, active_subscribers=0, monthly_price_total=0, yearly_price_total=0,
+                        total_subscribers_ever=0, revenue_collected=0, canceled=0, today=None):
+    """Apply an incremental change to a business's rollup row inside the caller's transaction
+
+    Deltas are applied with a single UPDATE ... SET col = col + delta so concurrent
+    writers never overwrite each other. If the row does not exist yet it is built
+    from the live tables, which already include the pending change. Loaded
+    BusinessMetrics objects are not refreshed until the caller commits.
+    """
+    current_month = (today or date.today()).replace(day=1)
+    values = {
+        BusinessMetrics.active_subscribers: BusinessMetrics.active_subscribers + active_subscribers,
+        BusinessMetrics.monthly_price_total: BusinessMetrics.monthly_price_total + monthly_price_total,
+        BusinessMetrics.yearly_price_total: BusinessMetrics.yearly_price_total + yearly_price_total,
+        BusinessMetrics.total_subscribers_ever: BusinessMetrics.total_subscribers_ever + total_subscribers_ever,
+        BusinessMetrics.revenue_collected: BusinessMetrics.revenue_collected + revenue_collected
+    }
+    if canceled:
+        values[BusinessMetrics.canceled_this_month] = case(
+            (BusinessMetrics.canceled_month == current_month, BusinessMetrics.canceled_this_month + canceled),
+            else_=canceled
+        )
+        values[BusinessMetrics.canceled_month] = current_month
+
+    db.session.flush()
+    mark_business_dirty(db.session, business_id)
+    result = db.session.execute(
+        db.update(BusinessMetrics).where(BusinessMetrics.business_id == business_id).values(values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        rebuild_business_metrics(business_id, today)
+
+def plan_price_delta(plan, sign=1, count=1, price=None, billing_interval=None):
+    """Return the monthly/yearly price total deltas for count subscriptions on a plan"""
+    price = Decimal(plan.price if price is None else price) * count * sign
+    interval = billing_interval or plan.billing_interval
+    if interval == 'monthly':
+        return {'monthly_price_total': price}
+    return {'yearly_price_total': price}
+
+def record_subscription_created(business_id, plan, status='active'):
+    deltas = {'total_subscribers_ever': 1}
+    if status == 'active':
+        deltas['active_subscribers'] = 1
+        deltas.update(plan_price_delta(plan))
+    apply_metrics_delta(business_id, **deltas)
+
+def record_subscription_canceled(business_id, plan, previous_status, previous_cancellation_date, today=None):
+    current_month = (today or date.today()).replace(day=1)
+    deltas = {}
+    if previous_status == 'active':
+        deltas['active_subscribers'] = -1
+        deltas.update(plan_price_delta(plan, sign=-1))
+    if previous_cancellation_date is None or previous_cancellation_date < current_month:
+        deltas['canceled'] = 1
+    if deltas:
+        apply_metrics_delta(business_id, today=today, **deltas)
+
+def record_plan_repriced(business_id, plan, old_price, old_interval):
+    """Move a plan's active subscriptions from its old price bucket to the new one"""
+    if Decimal(old_price) == Decimal(plan.price) and old_interval == plan.billing_interval:
+        return
+    active_count = Subscription.query.filter_by(plan_id=plan.plan_id, status='active').count()
+    if not active_count:
+        return
+
+    removed = plan_price_delta(plan, sign=-1, count=active_count, price=old_price, billing_interval=old_interval)
+    added = plan_price_delta(plan, count=active_count)
+    deltas = dict(removed)
+    for field, value in added.items():
+        deltas[field] = deltas.get(field, 0) + value
+    apply_metrics_delta(business_id, **deltas)
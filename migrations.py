@@ -0,0 +1,112 @@
+from sqlalchemy import inspect, literal
+from sqlalchemy.schema import CreateColumn
+from models import db, Customer, Subscription, Payment
+
+def add_missing_columns(connection, table):
+    """ALTER TABLE ADD COLUMN for model columns an older database does not have yet"""
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = str(CreateColumn(column).compile(dialect=connection.dialect))
+        if not column.nullable and column.server_default is None:
+            if column.default is not None and column.default.is_scalar:
+                # Existing rows need a value for the new NOT NULL column
+                default = literal(column.default.arg, column.type).compile(
+                    dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+                ddl = f'{ddl} DEFAULT {default}'
+            else:
+                # No value to give existing rows; added as nullable and backfilled
+                ddl = ddl.replace(' NOT NULL', '')
+        connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+        added.append(column.name)
+    return added
+
+# Indexes replaced by wider ones in models.py, dropped when an older database is upgraded
+REPLACED_INDEXES = {
+    'customers': ['ix_customers_business_id_lower_full_name', 'ix_customers_business_id_lower_email'],
+}
+
+def existing_index_names(connection, table_name):
+    if connection.dialect.name == 'sqlite':
+        # The SQLite inspector skips expression indexes, so read the catalog directly
+        rows = connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (table_name,))
+        return {row[0] for row in rows}
+    return {index['name'] for index in inspect(connection).get_indexes(table_name)}
+
+def upgrade_database():
+    """Bring an existing database up to the current models
+
+    Creates missing tables, adds missing (nullable or defaulted) columns,
+    creates any indexes that do not exist yet and drops the ones listed in
+    REPLACED_INDEXES. Safe to run repeatedly.
+    Returns a list of the changes made.
+    """
+    changes = []
+    with db.engine.begin() as connection:
+        existing_tables = set(inspect(connection).get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                table.create(connection)
+                changes.append(f'created table {table.name}')
+                continue
+
+            for column in add_missing_columns(connection, table):
+                changes.append(f'added column {table.name}.{column}')
+
+            existing_indexes = existing_index_names(connection, table.name)
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    changes.append(f'created index {index.name}')
+            for name in REPLACED_INDEXES.get(table.name, []):
+                if name in existing_indexes:
+                    connection.exec_driver_sql(f'DROP INDEX {name}')
+                    changes.append(f'dropped index {name}')
+
+        changes.extend(backfill_business_ids(connection))
+    return changes
+
+# Denormalized business_id
+def backfill_business_ids(connection, only_missing=True):
+    """Copy business_id down from customers to subscriptions and from subscriptions to payments"""
+    subscriptions = Subscription.__table__
+    payments = Payment.__table__
+    customers = Customer.__table__
+
+    subscription_update = db.update(subscriptions).values(
+        business_id=db.select(customers.c.business_id)
+        .where(customers.c.customer_id == subscriptions.c.customer_id).scalar_subquery()
+    )
+    payment_update = db.update(payments).values(
+        business_id=db.select(subscriptions.c.business_id)
+        .where(subscriptions.c.subscription_id == payments.c.subscription_id).scalar_subquery()
+    )
+    if only_missing:
+        subscription_update = subscription_update.where(subscriptions.c.business_id.is_(None))
+        payment_update = payment_update.where(payments.c.business_id.is_(None))
+
+    changes = []
+    count = connection.execute(subscription_update).rowcount
+    if count:
+        changes.append(f'backfilled business_id on {count} subscription(s)')
+    count = connection.execute(payment_update).rowcount
+    if count:
+        changes.append(f'backfilled business_id on {count} payment(s)')
+    return changes
+
+def find_business_id_drift():
+    """Count subscriptions and payments whose business_id no longer matches their parent"""
+    subscriptions = db.session.query(db.func.count(Subscription.subscription_id)).join(
+        Customer, Subscription.customer_id == Customer.customer_id
+    ).filter(
+        (Subscription.business_id != Customer.business_id) | Subscription.business_id.is_(None)
+    ).scalar()
+    payments = db.session.query(db.func.count(Payment.payment_id)).join(
+        Subscription, Payment.subscription_id == Subscription.subscription_id
+    ).filter(
+        (Payment.business_id != Subscription.business_id) | Payment.business_id.is_(None)
+    ).scalar()
+    return {'subscriptions': subscriptions, 'payments': payments}
@@ -2,8 +2,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, date, timedelta
 from decimal import Decimal
+from routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class Business(UserMixin, db.Model):
     __tablename__ = 'businesses'
@@ -18,6 +19,9 @@ class Business(UserMixin, db.Model):
 
 class Plan(db.Model):
     __tablename__ = 'plans'
+    __table_args__ = (
+        db.Index('ix_plans_business_id', 'business_id'),
+    )
     plan_id = db.Column(db.Integer, primary_key=True)
     business_id = db.Column(db.Integer, db.ForeignKey('businesses.business_id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -28,6 +32,12 @@ class Plan(db.Model):
 
 class Customer(db.Model):
     __tablename__ = 'customers'
+    __table_args__ = (
+        db.Index('ix_customers_business_id', 'business_id'),
+        db.Index('ix_customers_business_id_email', 'business_id', 'email'),
+        # Keyset pages sorted by join date
+        db.Index('ix_customers_business_id_created_at', 'business_id', 'created_at', 'customer_id'),
+    )
     customer_id = db.Column(db.Integer, primary_key=True)
     business_id = db.Column(db.Integer, db.ForeignKey('businesses.business_id'), nullable=False)
     full_name = db.Column(db.String(255), nullable=False)
@@ -39,21 +49,128 @@ class Customer(db.Model):
 
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        db.Index('ix_subscriptions_customer_id_status', 'customer_id', 'status'),
+        db.Index('ix_subscriptions_status_next_billing_date', 'status', 'next_billing_date'),
+        db.Index('ix_subscriptions_plan_id_status', 'plan_id', 'status'),
+        db.Index('ix_subscriptions_cancellation_date', 'cancellation_date'),
+        db.Index('ix_subscriptions_business_id_status_next_billing_date', 'business_id', 'status', 'next_billing_date'),
+        db.Index('ix_subscriptions_business_id_cancellation_date', 'business_id', 'cancellation_date'),
+        # Covers cohort/lifetime grouping, which reads only these columns
+        db.Index('ix_subscriptions_business_id_lifetime', 'business_id', 'start_date', 'cancellation_date', 'plan_id'),
+        # Due payment retries; only past_due subscriptions have a next_retry_at
+        db.Index('ix_subscriptions_next_retry_at', 'next_retry_at'),
+        # Keyset pages of the subscriptions list, unfiltered or by status, in ID order or by a sort
+        db.Index('ix_subscriptions_business_id_subscription_id', 'business_id', 'subscription_id'),
+        db.Index('ix_subscriptions_business_id_status_subscription_id', 'business_id', 'status', 'subscription_id'),
+        db.Index('ix_subscriptions_business_id_start_date', 'business_id', 'start_date', 'subscription_id'),
+        db.Index('ix_subscriptions_business_id_next_billing_date', 'business_id', 'next_billing_date',
+                 'subscription_id'),
+    )
     subscription_id = db.Column(db.Integer, primary_key=True)
+    business_id = db.Column(db.Integer, db.ForeignKey('businesses.business_id'), nullable=False)  # denormalized from customer
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.customer_id'), nullable=False)
     plan_id = db.Column(db.Integer, db.ForeignKey('plans.plan_id'), nullable=False)
     status = db.Column(db.String(20), nullable=False)  # 'active', 'canceled', 'past_due', 'trial'
     start_date = db.Column(db.Date, nullable=False)
     next_billing_date = db.Column(db.Date, nullable=False)
     cancellation_date = db.Column(db.Date, nullable=True)
+    retry_count = db.Column(db.Integer, nullable=False, default=0)  # failed retries since the payment first failed
+    next_retry_at = db.Column(db.DateTime, nullable=True)
     
     plan = db.relationship('Plan', backref='subscriptions')
     payments = db.relationship('Payment', backref='subscription', lazy=True)
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_subscription_id_payment_date', 'subscription_id', 'payment_date'),
+        db.Index('ix_payments_business_id_payment_date', 'business_id', 'payment_date'),
+    )
     payment_id = db.Column(db.Integer, primary_key=True)
+    business_id = db.Column(db.Integer, db.ForeignKey('businesses.business_id'), nullable=False)  # denormalized from subscription
     subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.subscription_id'), nullable=False)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), nullable=False)  # 'paid', 'failed' 
\ No newline at end of file
+    status = db.Column(db.String(20), nullable=False)  # 'paid', 'failed' 
+
+# Cold storage for payments older than the hot horizon, moved a month at a time by archive.py
+class PaymentArchive(db.Model):
+    __tablename__ = 'payment_archive'
+    __table_args__ = (
+        db.Index('ix_payment_archive_business_id_payment_date', 'business_id', 'payment_date'),
+    )
+    payment_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # kept from payments
+    business_id = db.Column(db.Integer, db.ForeignKey('businesses.business_id'), nullable=False)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.subscription_id'), nullable=False)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    payment_date = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+
+# Archived payments totalled per subscription and month, for reports that do not need each payment
+class PaymentSummary(db.Model):
+    __tablename__ = 'payment_summaries'
+    __table_args__ = (
+        db.Index('ix_payment_summaries_business_id_month', 'business_id', 'month'),
+    )
+    subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.subscription_id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    business_id = db.Column(db.Integer, db.ForeignKey('businesses.business_id'), nullable=False)
+    paid_count = db.Column(db.Integer, nullable=False, default=0)
+    paid_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+
+class BusinessMetrics(db.Model):
+    __tablename__ = 'business_metrics'
+    business_id = db.Column(db.Integer, db.ForeignKey('businesses.business_id'), primary_key=True)
+    active_subscribers = db.Column(db.Integer, nullable=False, default=0)
+    monthly_price_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # active monthly plans
+    yearly_price_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # active yearly plans
+    canceled_this_month = db.Column(db.Integer, nullable=False, default=0)
+    canceled_month = db.Column(db.Date, nullable=True)  # month canceled_this_month refers to
+    total_subscribers_ever = db.Column(db.Integer, nullable=False, default=0)
+    revenue_collected = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class BillingJob(db.Model):
+    __tablename__ = 'billing_jobs'
+    __table_args__ = (
+        db.Index('ix_billing_jobs_status', 'status'),
+        db.Index('ix_billing_jobs_business_id_status', 'business_id', 'status'),
+    )
+    job_id = db.Column(db.Integer, primary_key=True)
+    business_id = db.Column(db.Integer, db.ForeignKey('businesses.business_id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'completed', 'failed'
+    total_count = db.Column(db.Integer, nullable=True)
+    processed_count = db.Column(db.Integer, nullable=False, default=0)
+    run_date = db.Column(db.Date, nullable=True)  # billing date fixed when the job is first claimed
+    cursor_id = db.Column(db.Integer, nullable=False, default=0)  # last billed subscription_id
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+# Expression indexes for case-insensitive prefix search and keyset sorting of customers;
+# customer_id is the sort's tie-breaker
+db.Index('ix_customers_business_id_lower_full_name_id', Customer.business_id, db.func.lower(Customer.full_name),
+         Customer.customer_id)
+db.Index('ix_customers_business_id_lower_email_id', Customer.business_id, db.func.lower(Customer.email),
+         Customer.customer_id)
+
+class MetricsSnapshot(db.Model):
+    __tablename__ = 'metrics_snapshots'
+    business_id = db.Column(db.Integer, db.ForeignKey('businesses.business_id'), primary_key=True)
+    snapshot_date = db.Column(db.Date, primary_key=True)
+    active_subscribers = db.Column(db.Integer, nullable=False, default=0)  # at end of day
+    monthly_price_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # at end of day
+    yearly_price_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # at end of day
+    new_subscriptions = db.Column(db.Integer, nullable=False, default=0)
+    churned_subscriptions = db.Column(db.Integer, nullable=False, default=0)
+    revenue_collected = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+class TenantVersion(db.Model):
+    __tablename__ = 'tenant_versions'
+    business_id = db.Column(db.Integer, db.ForeignKey('businesses.business_id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)  # bumped by every commit touching the tenant's data
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,66 @@
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event
+from cache import MemoryCache
+from models import db, Business
+
+DEFAULT_TTL = 60  # seconds
+DEFAULT_MAX_ENTRIES = 10000
+
+class Principal(UserMixin):
+    """The logged-in business as routes see it: just the fields they read, detached from any session"""
+
+    def __init__(self, business_id, business_name):
+        self.business_id = business_id
+        self.business_name = business_name
+
+    def get_id(self):
+        return str(self.business_id)
+
+def init_principal_cache(app, session):
+    """Cache principals per process (PRINCIPAL_CACHE_TTL=0 disables) and drop them after business changes commit"""
+    ttl = int(app.config.get('PRINCIPAL_CACHE_TTL', DEFAULT_TTL))
+    max_entries = int(app.config.get('PRINCIPAL_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
+    app.extensions['principal_cache'] = MemoryCache(ttl=ttl, max_entries=max_entries) if ttl > 0 else None
+    register_principal_invalidation(session)
+
+def get_principal_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('principal_cache')
+
+def load_principal(business_id):
+    """Return the Principal for business_id, or None if the business no longer exists"""
+    cache = get_principal_cache()
+    fields = cache.get(business_id) if cache is not None else None
+    if fields is None:
+        row = db.session.query(Business.business_id, Business.business_name).filter(
+            Business.business_id == business_id).first()
+        if row is None:
+            return None
+        fields = tuple(row)
+        if cache is not None:
+            cache.set(business_id, fields)
+    return Principal(*fields)
+
+# Invalidation: other processes see a change once their entry expires
+def collect_changed_businesses(session, flush_context, instances):
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Business):
+            session.info.setdefault('changed_principals', set()).add(obj.business_id)
+
+def invalidate_principals(session):
+    changed = session.info.pop('changed_principals', None)
+    cache = get_principal_cache()
+    if changed and cache is not None:
+        for business_id in changed:
+            cache.delete(business_id)
+
+def discard_changed_businesses(session):
+    session.info.pop('changed_principals', None)
+
+def register_principal_invalidation(session):
+    if not event.contains(session, 'before_flush', collect_changed_businesses):
+        event.listen(session, 'before_flush', collect_changed_businesses)
+        event.listen(session, 'after_commit', invalidate_principals)
+        event.listen(session, 'after_rollback', discard_changed_businesses)
@@ -1,9 +1,22 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date, timedelta
 from decimal import Decimal
-from models import db, Business, Plan, Customer, Subscription, Payment
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from models import db, Business, Plan, Customer, Subscription, Payment, BillingJob
+from metrics import (cached_business_metrics, record_subscription_created, record_subscription_canceled,
+                     record_plan_repriced)
+from jobs import enqueue_billing_job, job_progress
+from cache import get_cache
+from importer import import_records, detect_format, IMPORT_KINDS
+from exporter import (subscriptions_export_query, payments_export_query, stream_export, parse_date_arg,
+                      EXPORT_FORMATS)
+from snapshots import monthly_timeseries
+from analytics import REPORTS as ANALYTICS_REPORTS
+from listing import list_customers, list_subscriptions, page_size, SUBSCRIPTION_STATUSES
+from bulk import bulk_update_subscriptions, OPERATIONS as BULK_OPERATIONS
 
 # Authentication Routes
 def register_route():
@@ -28,7 +41,7 @@ def register_route():
             db.session.commit()
             
             flash('Registration successful! Please log in.')
-            return redirect(url_for('login'))
+            return redirect(url_for('web.login'))
         except Exception as e:
             db.session.rollback()
             flash('Registration failed. Please try again.')
@@ -46,7 +59,7 @@ def login_route():
             business = Business.query.filter_by(owner_email=email).first()
             if business and check_password_hash(business.password_hash, password):
                 login_user(business)
-                return redirect(url_for('dashboard'))
+                return redirect(url_for('web.dashboard'))
             else:
                 flash('Invalid email or password')
         except Exception as e:
@@ -57,56 +70,75 @@ def login_route():
 
 def logout_route():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('web.index'))
 
 # Dashboard Routes
 def dashboard_route():
     try:
-        # Calculate metrics
-        active_subscriptions = Subscription.query.join(Customer).filter(
-            Customer.business_id == current_user.business_id,
-            Subscription.status == 'active'
-        ).count()
-        
-        # Calculate MRR (Monthly Recurring Revenue)
-        active_subs = Subscription.query.join(Customer).join(Plan).filter(
-            Customer.business_id == current_user.business_id,
-            Subscription.status == 'active'
-        ).all()
-        
-        mrr = Decimal('0.0')
-        for sub in active_subs:
-            if sub.plan.billing_interval == 'monthly':
-                mrr += sub.plan.price
-            else:  # yearly
-                mrr += sub.plan.price / 12
-        
-        # Calculate churn rate
-        current_month = date.today().replace(day=1)
-        canceled_this_month = Subscription.query.join(Customer).filter(
-            Customer.business_id == current_user.business_id,
-            Subscription.cancellation_date >= current_month
-        ).count()
-        
-        total_subscribers_ever = Subscription.query.join(Customer).filter(
-            Customer.business_id == current_user.business_id
-        ).count()
-        
-        churn_rate = (canceled_this_month / total_subscribers_ever * 100) if total_subscribers_ever > 0 else 0
+        metrics = cached_business_metrics(current_user.business_id)
         
         return render_template('dashboard.html', 
-                             mrr=mrr, 
-                             active_subscribers=active_subscriptions,
-                             churn_rate=round(churn_rate, 2))
+                             mrr=metrics['mrr'], 
+                             active_subscribers=metrics['active_subscribers'],
+                             churn_rate=metrics['churn_rate'])
     except Exception as e:
         flash('Error loading dashboard. Please try again.')
         print(f"Dashboard error: {e}")
         return render_template('dashboard.html', mrr=0, active_subscribers=0, churn_rate=0)
 
+def list_params():
+    """Read search, filter, sort and keyset cursor arguments shared by list pages and APIs"""
+    status = request.args.get('status') or None
+    return {
+        'search': (request.args.get('q') or '').strip() or None,
+        'status': status if status in SUBSCRIPTION_STATUSES else None,
+        'sort': request.args.get('sort') or None,
+        'descending': request.args.get('order') == 'desc',
+        'cursor': request.args.get('cursor') or None,
+        'limit': page_size(request.args.get('limit'))
+    }
+
+def next_page_url(next_cursor):
+    if not next_cursor:
+        return None
+    args = request.args.to_dict()
+    args['cursor'] = next_cursor
+    return url_for(request.endpoint, **args)
+
+def customers_page(params):
+    counts = active_subscription_counts(Subscription.customer_id)
+    query = db.session.query(Customer, func.coalesce(counts.c.active_count, 0)).outerjoin(
+        counts, counts.c.key == Customer.customer_id
+    ).filter(Customer.business_id == current_user.business_id)
+    return list_customers(query, params['search'], params['sort'], params['cursor'],
+                          params['limit'], params['descending'])
+
+def subscriptions_page(params):
+    query = Subscription.query.options(
+        joinedload(Subscription.customer),
+        joinedload(Subscription.plan)
+    ).filter_by(business_id=current_user.business_id)
+    rows, next_cursor = list_subscriptions(query, current_user.business_id, params['search'], params['status'],
+                                           params['sort'], params['cursor'], params['limit'], params['descending'])
+    return [subscription for (subscription,) in rows], next_cursor
+
+def active_subscription_counts(column):
+    """Subquery of active subscription counts for the current business grouped by column"""
+    return db.session.query(
+        column.label('key'),
+        func.count(Subscription.subscription_id).label('active_count')
+    ).filter(
+        Subscription.business_id == current_user.business_id,
+        Subscription.status == 'active'
+    ).group_by(column).subquery()
+
 # Plan Management Routes
 def plans_route():
     try:
-        plans = Plan.query.filter_by(business_id=current_user.business_id).all()
+        counts = active_subscription_counts(Subscription.plan_id)
+        plans = db.session.query(Plan, func.coalesce(counts.c.active_count, 0)).outerjoin(
+            counts, counts.c.key == Plan.plan_id
+        ).filter(Plan.business_id == current_user.business_id).all()
         return render_template('plans.html', plans=plans)
     except Exception as e:
         flash('Error loading plans. Please try again.')
@@ -130,7 +162,7 @@ def new_plan_route():
             db.session.commit()
             
             flash('Plan created successfully!')
-            return redirect(url_for('plans'))
+            return redirect(url_for('web.plans'))
         except Exception as e:
             db.session.rollback()
             flash('Error creating plan. Please try again.')
@@ -144,13 +176,15 @@ def edit_plan_route(plan_id):
         
         if request.method == 'POST':
             try:
+                old_price, old_interval = plan.price, plan.billing_interval
                 plan.name = request.form['name']
                 plan.price = Decimal(request.form['price'])
                 plan.billing_interval = request.form['billing_interval']
+                record_plan_repriced(current_user.business_id, plan, old_price, old_interval)
                 db.session.commit()
                 
                 flash('Plan updated successfully!')
-                return redirect(url_for('plans'))
+                return redirect(url_for('web.plans'))
             except Exception as e:
                 db.session.rollback()
                 flash('Error updating plan. Please try again.')
@@ -159,7 +193,7 @@ def edit_plan_route(plan_id):
         return render_template('edit_plan.html', plan=plan)
     except Exception as e:
         flash('Plan not found.')
-        return redirect(url_for('plans'))
+        return redirect(url_for('web.plans'))
 
 def delete_plan_route(plan_id):
     try:
@@ -173,17 +207,20 @@ def delete_plan_route(plan_id):
         flash('Error deleting plan. Please try again.')
         print(f"Delete plan error: {e}")
     
-    return redirect(url_for('plans'))
+    return redirect(url_for('web.plans'))
 
 # Customer Management Routes
 def customers_route():
     try:
-        customers = Customer.query.filter_by(business_id=current_user.business_id).all()
-        return render_template('customers.html', customers=customers)
+        customers, next_cursor = customers_page(list_params())
+        return render_template('customers.html', customers=customers, next_url=next_page_url(next_cursor))
+    except ValueError:
+        flash('That page link has expired. Showing the first page.')
+        return redirect(url_for('web.customers', q=request.args.get('q', '')))
     except Exception as e:
         flash('Error loading customers. Please try again.')
         print(f"Customers error: {e}")
-        return render_template('customers.html', customers=[])
+        return render_template('customers.html', customers=[], next_url=None)
 
 def new_customer_route():
     if request.method == 'POST':
@@ -200,7 +237,7 @@ def new_customer_route():
             db.session.commit()
             
             flash('Customer added successfully!')
-            return redirect(url_for('customers'))
+            return redirect(url_for('web.customers'))
         except Exception as e:
             db.session.rollback()
             flash('Error adding customer. Please try again.')
@@ -219,7 +256,7 @@ def edit_customer_route(customer_id):
                 db.session.commit()
                 
                 flash('Customer updated successfully!')
-                return redirect(url_for('customers'))
+                return redirect(url_for('web.customers'))
             except Exception as e:
                 db.session.rollback()
                 flash('Error updating customer. Please try again.')
@@ -228,19 +265,21 @@ def edit_customer_route(customer_id):
         return render_template('edit_customer.html', customer=customer)
     except Exception as e:
         flash('Customer not found.')
-        return redirect(url_for('customers'))
+        return redirect(url_for('web.customers'))
 
 # Subscription Management Routes
 def subscriptions_route():
     try:
-        subscriptions = Subscription.query.join(Customer).filter(
-            Customer.business_id == current_user.business_id
-        ).all()
-        return render_template('subscriptions.html', subscriptions=subscriptions)
+        subscriptions, next_cursor = subscriptions_page(list_params())
+        return render_template('subscriptions.html', subscriptions=subscriptions,
+                               statuses=SUBSCRIPTION_STATUSES, next_url=next_page_url(next_cursor))
+    except ValueError:
+        flash('That page link has expired. Showing the first page.')
+        return redirect(url_for('web.subscriptions', q=request.args.get('q', ''), status=request.args.get('status', '')))
     except Exception as e:
         flash('Error loading subscriptions. Please try again.')
         print(f"Subscriptions error: {e}")
-        return render_template('subscriptions.html', subscriptions=[])
+        return render_template('subscriptions.html', subscriptions=[], statuses=SUBSCRIPTION_STATUSES, next_url=None)
 
 def new_subscription_route():
     if request.method == 'POST':
@@ -260,6 +299,7 @@ def new_subscription_route():
                 next_billing_date = start_date + timedelta(days=365)
             
             subscription = Subscription(
+                business_id=current_user.business_id,
                 customer_id=customer_id,
                 plan_id=plan_id,
                 status='active',
@@ -267,10 +307,11 @@ def new_subscription_route():
                 next_billing_date=next_billing_date
             )
             db.session.add(subscription)
+            record_subscription_created(current_user.business_id, plan, subscription.status)
             db.session.commit()
             
             flash('Subscription created successfully!')
-            return redirect(url_for('subscriptions'))
+            return redirect(url_for('web.subscriptions'))
         except Exception as e:
             db.session.rollback()
             flash('Error creating subscription. Please try again.')
@@ -287,13 +328,16 @@ def new_subscription_route():
 
 def cancel_subscription_route(subscription_id):
     try:
-        subscription = Subscription.query.join(Customer).filter(
-            Subscription.subscription_id == subscription_id,
-            Customer.business_id == current_user.business_id
+        subscription = Subscription.query.filter_by(
+            subscription_id=subscription_id,
+            business_id=current_user.business_id
         ).first_or_404()
         
+        previous_status, previous_cancellation_date = subscription.status, subscription.cancellation_date
         subscription.status = 'canceled'
         subscription.cancellation_date = date.today()
+        record_subscription_canceled(current_user.business_id, subscription.plan,
+                                     previous_status, previous_cancellation_date)
         db.session.commit()
         
         flash('Subscription canceled successfully!')
@@ -302,45 +346,17 @@ def cancel_subscription_route(subscription_id):
         flash('Error canceling subscription. Please try again.')
         print(f"Cancel subscription error: {e}")
     
-    return redirect(url_for('subscriptions'))
+    return redirect(url_for('web.subscriptions'))
 
 # API Routes
 def api_metrics_route():
     try:
-        # Calculate metrics for API
-        active_subscriptions = Subscription.query.join(Customer).filter(
-            Customer.business_id == current_user.business_id,
-            Subscription.status == 'active'
-        ).count()
-        
-        active_subs = Subscription.query.join(Customer).join(Plan).filter(
-            Customer.business_id == current_user.business_id,
-            Subscription.status == 'active'
-        ).all()
-        
-        mrr = Decimal('0.0')
-        for sub in active_subs:
-            if sub.plan.billing_interval == 'monthly':
-                mrr += sub.plan.price
-            else:  # yearly
-                mrr += sub.plan.price / 12
-        
-        current_month = date.today().replace(day=1)
-        canceled_this_month = Subscription.query.join(Customer).filter(
-            Customer.business_id == current_user.business_id,
-            Subscription.cancellation_date >= current_month
-        ).count()
-        
-        total_subscribers_ever = Subscription.query.join(Customer).filter(
-            Customer.business_id == current_user.business_id
-        ).count()
-        
-        churn_rate = (canceled_this_month / total_subscribers_ever * 100) if total_subscribers_ever > 0 else 0
+        metrics = cached_business_metrics(current_user.business_id)
         
         return jsonify({
-            'mrr': float(mrr),
-            'active_subscribers': active_subscriptions,
-            'churn_rate': round(churn_rate, 2)
+            'mrr': float(metrics['mrr']),
+            'active_subscribers': metrics['active_subscribers'],
+            'churn_rate': metrics['churn_rate']
         })
     except Exception as e:
         print(f"API metrics error: {e}")
@@ -350,47 +366,173 @@ def api_metrics_route():
             'churn_rate': 0.0
         })
 
+def api_customers_route():
+    try:
+        customers, next_cursor = customers_page(list_params())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'customers': [{
+            'customer_id': customer.customer_id,
+            'full_name': customer.full_name,
+            'email': customer.email,
+            'active_subscriptions': active_count,
+            'created_at': customer.created_at.isoformat() if customer.created_at else None
+        } for customer, active_count in customers],
+        'next_cursor': next_cursor
+    })
+
+def api_subscriptions_route():
+    try:
+        subscriptions, next_cursor = subscriptions_page(list_params())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'subscriptions': [{
+            'subscription_id': subscription.subscription_id,
+            'customer_id': subscription.customer_id,
+            'customer_name': subscription.customer.full_name,
+            'plan_id': subscription.plan_id,
+            'plan_name': subscription.plan.name,
+            'status': subscription.status,
+            'start_date': subscription.start_date.isoformat(),
+            'next_billing_date': subscription.next_billing_date.isoformat(),
+            'cancellation_date': subscription.cancellation_date.isoformat() if subscription.cancellation_date else None
+        } for subscription in subscriptions],
+        'next_cursor': next_cursor
+    })
+
+def api_bulk_subscriptions_route(operation):
+    """Cancel, migrate or reschedule the subscriptions selected by a JSON filter or ID list"""
+    if operation not in BULK_OPERATIONS:
+        return jsonify({'error': f'Unknown bulk operation: {operation}'}), 404
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'expected a JSON object'}), 400
+    try:
+        subscription_ids = body.get('subscription_ids')
+        if subscription_ids is not None:
+            subscription_ids = [int(subscription_id) for subscription_id in subscription_ids]
+        report = bulk_update_subscriptions(
+            current_user.business_id, operation,
+            plan_id=int(body['plan_id']) if body.get('plan_id') is not None else None,
+            status=body.get('status') or None,
+            start_from=parse_date_arg(body.get('start_from'), 'start_from'),
+            start_to=parse_date_arg(body.get('start_to'), 'start_to'),
+            subscription_ids=subscription_ids,
+            target_plan_id=int(body['target_plan_id']) if body.get('target_plan_id') is not None else None,
+            next_billing_date=parse_date_arg(body.get('next_billing_date'), 'next_billing_date'),
+            dry_run=bool(body.get('dry_run'))
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"Bulk {operation} error: {e}")
+        return jsonify({'error': f'Bulk {operation} failed. Chunks committed before the failure were kept.'}), 500
+
+    return jsonify(report)
+
+def api_cache_stats_route():
+    cache = get_cache()
+    if cache is None:
+        return jsonify({'backend': None})
+    return jsonify(dict(cache.stats.as_dict(), backend=type(cache).__name__))
+
+def api_import_route(kind):
+    if kind not in IMPORT_KINDS:
+        return jsonify({'error': f'Unknown import type: {kind}'}), 404
+
+    upload = request.files.get('file')
+    try:
+        fmt = detect_format(upload.filename if upload else None, request.args.get('format'))
+        report = import_records(kind, current_user.business_id, upload.stream if upload else request.stream, fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"Import error: {e}")
+        return jsonify({'error': 'Import failed. Rows committed before the failure were kept.'}), 500
+
+    return jsonify(report)
+
+EXPORT_QUERIES = {
+    'subscriptions': subscriptions_export_query,
+    'payments': payments_export_query,
+}
+
+def api_export_route(kind):
+    if kind not in EXPORT_QUERIES:
+        return jsonify({'error': f'Unknown export type: {kind}'}), 404
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        query = EXPORT_QUERIES[kind](
+            current_user.business_id,
+            status=request.args.get('status') or None,
+            date_from=parse_date_arg(request.args.get('from'), 'from'),
+            date_to=parse_date_arg(request.args.get('to'), 'to')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f"{kind}-{date.today().isoformat()}.{fmt}"
+    return Response(
+        stream_with_context(stream_export(query, fmt)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+def api_metrics_timeseries_route():
+    """Monthly MRR, new/churned/net subscriptions and revenue read from daily snapshots"""
+    try:
+        date_to = parse_date_arg(request.args.get('to'), 'to') or date.today()
+        date_from = parse_date_arg(request.args.get('from'), 'from') or date(date_to.year - 1, date_to.month, 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if date_from > date_to:
+        return jsonify({'error': 'from must not be after to'}), 400
+
+    return jsonify({
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'months': monthly_timeseries(current_user.business_id, date_from, date_to)
+    })
+
+def api_analytics_route(report):
+    """Cohort retention or per-plan LTV, optionally limited to subscriptions started since a date"""
+    if report not in ANALYTICS_REPORTS:
+        return jsonify({'error': f'Unknown report: {report}'}), 404
+    try:
+        since = parse_date_arg(request.args.get('since'), 'since')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'report': report,
+        'since': since.isoformat() if since else None,
+        'rows': ANALYTICS_REPORTS[report](current_user.business_id, since=since)
+    })
+
 # Billing Routes
 def run_billing_route():
-    """Simulate billing cycle for all active subscriptions"""
+    """Queue a billing cycle for the background worker"""
     try:
-        today = date.today()
-        
-        # Find all active subscriptions that need billing
-        subscriptions_to_bill = Subscription.query.join(Customer).filter(
-            Customer.business_id == current_user.business_id,
-            Subscription.status == 'active',
-            Subscription.next_billing_date <= today
-        ).all()
-        
-        processed_count = 0
-        for subscription in subscriptions_to_bill:
-            try:
-                # Create payment record
-                payment = Payment(
-                    subscription_id=subscription.subscription_id,
-                    amount=subscription.plan.price,
-                    status='paid'
-                )
-                db.session.add(payment)
-                
-                # Update next billing date
-                if subscription.plan.billing_interval == 'monthly':
-                    subscription.next_billing_date = subscription.next_billing_date + timedelta(days=30)
-                else:  # yearly
-                    subscription.next_billing_date = subscription.next_billing_date + timedelta(days=365)
-                
-                processed_count += 1
-            except Exception as e:
-                print(f"Error processing subscription {subscription.subscription_id}: {e}")
-                continue
+        job = enqueue_billing_job(current_user.business_id)
         
-        db.session.commit()
-        
-        flash(f'Billing cycle completed! Processed {processed_count} subscriptions.')
+        flash(f'Billing cycle queued as job #{job.job_id}. It will run in the background.')
     except Exception as e:
         db.session.rollback()
-        flash('Error running billing cycle. Please try again.')
+        flash('Error queuing billing cycle. Please try again.')
         print(f"Billing error: {e}")
     
-    return redirect(url_for('dashboard')) 
\ No newline at end of file
+    return redirect(url_for('web.dashboard'))
+
+def billing_job_status_route(job_id):
+    job = BillingJob.query.filter_by(job_id=job_id, business_id=current_user.business_id).first_or_404()
+    return jsonify(job_progress(job))
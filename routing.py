@@ -0,0 +1,104 @@
+import threading
+import time
+from functools import wraps
+from flask import current_app, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+DEFAULT_RETRY_SECONDS = 30
+DEFAULT_STICKY_SECONDS = 5
+
+class ReplicaSet:
+    """Read replica engines handed out round-robin, skipping any that failed in the last retry_seconds"""
+
+    def __init__(self, engines, retry_seconds=DEFAULT_RETRY_SECONDS):
+        self.engines = list(engines)
+        self.retry_seconds = retry_seconds
+        self.down_until = {}
+        self.position = 0
+        self.lock = threading.Lock()
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self.on_error)
+
+    def choose(self):
+        """The next healthy replica, or None when all are down"""
+        now = time.monotonic()
+        with self.lock:
+            for _ in range(len(self.engines)):
+                engine = self.engines[self.position % len(self.engines)]
+                self.position += 1
+                if self.down_until.get(engine, 0) <= now:
+                    return engine
+        return None
+
+    def mark_down(self, engine):
+        with self.lock:
+            self.down_until[engine] = time.monotonic() + self.retry_seconds
+
+    def on_error(self, context):
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+            self.mark_down(context.engine)
+
+class RoutingSession(Session):
+    """db.session that sends a read_only request's SELECTs to a replica
+
+    Everything else goes to the primary: flushes, INSERT/UPDATE/DELETE, and
+    every statement after the session's first write, so a request reads its
+    own writes. One replica is used per session, so a request sees one
+    consistent snapshot. A replica that cannot be reached is skipped.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if self._flushing:
+            self.info['wrote'] = True
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+    def replica(self):
+        if 'replica' not in self.info:
+            self.info['replica'] = self.connect_replica()
+        return self.info['replica']
+
+    def connect_replica(self):
+        replicas = current_app.extensions.get('replicas')
+        while replicas is not None:
+            engine = replicas.choose()
+            if engine is None:
+                return None
+            try:
+                self.connection(bind_arguments={'bind': engine})  # checked out now so an unreachable replica falls back
+                return engine
+            except OperationalError:
+                replicas.mark_down(engine)
+        return None
+
+def route_statement(orm_execute_state):
+    """Bind a read_only session's SELECTs to its replica until the session first writes"""
+    info = orm_execute_state.session.info
+    if not orm_execute_state.is_select:
+        info['wrote'] = True
+    elif info.get('read_only') and not info.get('wrote') and 'bind' not in orm_execute_state.bind_arguments:
+        replica = orm_execute_state.session.replica()
+        if replica is not None:
+            orm_execute_state.bind_arguments['bind'] = replica
+
+# First, so any other hook that runs the statement itself sees the replica bind
+event.listen(RoutingSession, 'do_orm_execute', route_statement, insert=True)
+
+def read_only(view):
+    """Serve a GET view from a read replica, unless this client wrote within REPLICA_STICKY_SECONDS"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if (request.method == 'GET' and current_app.extensions.get('replicas') is not None
+                and session.get('_primary_until', 0) <= time.time()):
+            current_app.extensions['sqlalchemy'].session.info['read_only'] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+def remember_writes(response):
+    """Keep a client that just wrote on the primary for REPLICA_STICKY_SECONDS, so it reads its own writes"""
+    db_session = current_app.extensions['sqlalchemy'].session
+    if db_session.registry.has() and db_session.info.get('wrote'):
+        session['_primary_until'] = time.time() + current_app.config.get('REPLICA_STICKY_SECONDS',
+                                                                         DEFAULT_STICKY_SECONDS)
+    return response
@@ -0,0 +1,212 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import func, case
+from sqlalchemy.exc import IntegrityError
+from models import db, Plan, Subscription, Payment, PaymentArchive, MetricsSnapshot
+from cache import mark_business_dirty
+
+def price_columns():
+    """Summed monthly and yearly plan prices, kept apart so MRR is computed exactly in Python"""
+    return (
+        func.sum(case((Plan.billing_interval == 'monthly', Plan.price), else_=0)),
+        func.sum(case((Plan.billing_interval != 'monthly', Plan.price), else_=0))
+    )
+
+def churn_date():
+    """The day a subscription stopped counting as active; a cancellation dated before the start counts on the start day"""
+    return case(
+        (Subscription.cancellation_date < Subscription.start_date, Subscription.start_date),
+        else_=Subscription.cancellation_date
+    )
+
+def daily_events(date_column, date_from, date_to, business_id=None):
+    """Count subscriptions (and their plan prices) per business per day of date_column"""
+    query = db.session.query(
+        Subscription.business_id, date_column, func.count(Subscription.subscription_id), *price_columns()
+    ).join(Plan, Subscription.plan_id == Plan.plan_id).filter(
+        date_column >= date_from, date_column <= date_to
+    )
+    if business_id is not None:
+        query = query.filter(Subscription.business_id == business_id)
+    return query.group_by(Subscription.business_id, date_column)
+
+def daily_revenue(payments, date_from, date_to, business_id=None):
+    """Sum paid amounts per business per day from payments or the payment archive"""
+    payment_day = func.date(payments.payment_date, type_=db.Date)
+    query = db.session.query(payments.business_id, payment_day, func.sum(payments.amount)).filter(
+        payments.status == 'paid',
+        payments.payment_date >= datetime.combine(date_from, datetime.min.time()),
+        payments.payment_date < datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+    )
+    if business_id is not None:
+        query = query.filter(payments.business_id == business_id)
+    return query.group_by(payments.business_id, payment_day)
+
+def current_active_totals(business_id=None):
+    """Active subscriptions and plan price totals per business by status, the rule the business_metrics rollup uses"""
+    query = db.session.query(
+        Subscription.business_id, func.count(Subscription.subscription_id), *price_columns()
+    ).join(Plan, Subscription.plan_id == Plan.plan_id).filter(Subscription.status == 'active')
+    if business_id is not None:
+        query = query.filter(Subscription.business_id == business_id)
+    return {row_business_id: (active, Decimal(monthly or 0), Decimal(yearly or 0))
+            for row_business_id, active, monthly, yearly in query.group_by(Subscription.business_id)}
+
+def compute_snapshots(date_from, date_to, business_id=None, today=None):
+    """Build daily snapshot rows for [date_from, date_to] from a handful of grouped queries
+
+    Statuses have no history, so for past days a subscription counts as
+    active on day D when start_date <= D and it has no cancellation_date on
+    or before D. Active counts and price totals are rolled forward from the
+    state before date_from using each day's new and churned subscriptions,
+    so the cost does not depend on the number of days. From yesterday on,
+    the day snapshot_if_due writes, active counts and price totals come from
+    current statuses instead, like the business_metrics rollup: past_due,
+    trial and canceled subscriptions are not active, so the latest month of
+    the time series matches the dashboard MRR. Prices are the plans'
+    current prices.
+    """
+    current_from = (today or date.today()) - timedelta(days=1)
+    current = current_active_totals(business_id) if date_to >= current_from else {}
+    baseline_query = db.session.query(
+        Subscription.business_id, func.count(Subscription.subscription_id), *price_columns()
+    ).join(Plan, Subscription.plan_id == Plan.plan_id).filter(
+        Subscription.start_date < date_from,
+        (Subscription.cancellation_date.is_(None)) | (Subscription.cancellation_date >= date_from)
+    )
+    if business_id is not None:
+        baseline_query = baseline_query.filter(Subscription.business_id == business_id)
+
+    state = {}
+    for row_business_id, active, monthly, yearly in baseline_query.group_by(Subscription.business_id):
+        state[row_business_id] = [active, Decimal(monthly or 0), Decimal(yearly or 0)]
+
+    events = defaultdict(lambda: defaultdict(lambda: [0, Decimal('0'), Decimal('0'), 0, Decimal('0'), Decimal('0'), Decimal('0')]))
+    for row_business_id, day, count, monthly, yearly in daily_events(Subscription.start_date, date_from, date_to, business_id):
+        entry = events[row_business_id][day]
+        entry[0] += count
+        entry[1] += Decimal(monthly or 0)
+        entry[2] += Decimal(yearly or 0)
+    for row_business_id, day, count, monthly, yearly in daily_events(churn_date(), date_from, date_to, business_id):
+        entry = events[row_business_id][day]
+        entry[3] += count
+        entry[4] += Decimal(monthly or 0)
+        entry[5] += Decimal(yearly or 0)
+
+    for payments in (Payment, PaymentArchive):  # backfills reach into archived months
+        for row_business_id, day, amount in daily_revenue(payments, date_from, date_to, business_id):
+            events[row_business_id][day][6] += Decimal(amount or 0)
+
+    for row_business_id in sorted(set(state) | set(events) | set(current)):
+        active, monthly, yearly = state.get(row_business_id, [0, Decimal('0'), Decimal('0')])
+        business_events = events.get(row_business_id, {})
+        day = date_from
+        while day <= date_to:
+            new, new_monthly, new_yearly, churned, churned_monthly, churned_yearly, revenue = \
+                business_events.get(day, (0, 0, 0, 0, 0, 0, 0))
+            active += new - churned
+            monthly += new_monthly - churned_monthly
+            yearly += new_yearly - churned_yearly
+            day_active, day_monthly, day_yearly = active, monthly, yearly
+            if day >= current_from:
+                day_active, day_monthly, day_yearly = current.get(row_business_id, (0, Decimal('0'), Decimal('0')))
+            yield {
+                'business_id': row_business_id,
+                'snapshot_date': day,
+                'active_subscribers': day_active,
+                'monthly_price_total': day_monthly,
+                'yearly_price_total': day_yearly,
+                'new_subscriptions': new,
+                'churned_subscriptions': churned,
+                'revenue_collected': revenue
+            }
+            day += timedelta(days=1)
+
+def write_snapshots(date_from, date_to, business_id=None, batch_size=5000):
+    """Replace the snapshots for [date_from, date_to] and return how many rows were written"""
+    delete = db.delete(MetricsSnapshot).where(
+        MetricsSnapshot.snapshot_date >= date_from, MetricsSnapshot.snapshot_date <= date_to
+    )
+    if business_id is not None:
+        delete = delete.where(MetricsSnapshot.business_id == business_id)
+    db.session.execute(delete)
+
+    written = 0
+    batch = []
+    for row in compute_snapshots(date_from, date_to, business_id):
+        mark_business_dirty(db.session, row['business_id'])  # time series responses change
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(db.insert(MetricsSnapshot), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(MetricsSnapshot), batch)
+        written += len(batch)
+    db.session.commit()
+    return written
+
+def snapshot_if_due(today=None):
+    """Write yesterday's snapshots unless they already exist; cheap enough to call on every idle poll"""
+    yesterday = (today or date.today()) - timedelta(days=1)
+    if snapshot_if_due.last_day == yesterday:
+        return 0
+    exists = db.session.query(MetricsSnapshot.snapshot_date).filter_by(snapshot_date=yesterday).first()
+    written = 0
+    if exists is None:
+        latest = db.session.query(func.max(MetricsSnapshot.snapshot_date)).scalar()
+        # Fill any gap since the last snapshot (e.g. after the worker was down)
+        date_from = latest + timedelta(days=1) if latest else yesterday
+        try:
+            written = write_snapshots(date_from, yesterday)
+        except IntegrityError:
+            # Another worker wrote the same days first
+            db.session.rollback()
+    snapshot_if_due.last_day = yesterday
+    return written
+
+snapshot_if_due.last_day = None
+
+# Time series
+def monthly_timeseries(business_id, date_from, date_to):
+    """Roll daily snapshots up into calendar months
+
+    MRR and active subscribers are taken from the last snapshot in each month;
+    new, churned and revenue are summed over the month.
+    """
+    snapshots = db.session.query(
+        MetricsSnapshot.snapshot_date,
+        MetricsSnapshot.active_subscribers,
+        MetricsSnapshot.monthly_price_total,
+        MetricsSnapshot.yearly_price_total,
+        MetricsSnapshot.new_subscriptions,
+        MetricsSnapshot.churned_subscriptions,
+        MetricsSnapshot.revenue_collected
+    ).filter(
+        MetricsSnapshot.business_id == business_id,
+        MetricsSnapshot.snapshot_date >= date_from,
+        MetricsSnapshot.snapshot_date <= date_to
+    ).order_by(MetricsSnapshot.snapshot_date)
+
+    months = {}
+    for day, active, monthly, yearly, new, churned, revenue in snapshots:
+        month = day.strftime('%Y-%m')
+        entry = months.setdefault(month, {
+            'month': month, 'new_subscriptions': 0, 'churned_subscriptions': 0, 'revenue': Decimal('0')
+        })
+        entry['new_subscriptions'] += new
+        entry['churned_subscriptions'] += churned
+        entry['revenue'] += Decimal(revenue)
+        entry['active_subscribers'] = active
+        entry['mrr'] = Decimal(monthly) + Decimal(yearly) / 12
+        entry['as_of'] = day
+
+    series = []
+    for entry in months.values():
+        entry['net_subscriptions'] = entry['new_subscriptions'] - entry['churned_subscriptions']
+        entry['mrr'] = float(round(entry['mrr'], 2))
+        entry['revenue'] = float(entry['revenue'])
+        entry['as_of'] = entry['as_of'].isoformat()
+        series.append(entry)
+    return series
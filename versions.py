@@ -0,0 +1,92 @@
+from datetime import date, datetime
+from functools import wraps
+from flask import g, has_app_context, request, make_response, session as flask_session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from models import db, TenantVersion
+
+# Per-tenant version counters
+def bump_versions(session):
+    """Bump the version of every business whose data this transaction changed
+
+    Runs in before_commit, so the bump commits (or rolls back) together with
+    the change. Businesses are collected by cache.mark_business_dirty.
+    """
+    session.flush()
+    dirty = session.info.get('dirty_businesses')
+    if not dirty:
+        return
+    if has_app_context():
+        g.pop('tenant_versions', None)  # read again after this commit
+
+    business_ids = sorted(dirty)  # a fixed order so concurrent commits lock rows alike
+    now = datetime.utcnow()
+    bump = db.update(TenantVersion).values(version=TenantVersion.version + 1, updated_at=now) \
+        .execution_options(synchronize_session=False)
+    result = session.execute(bump.where(TenantVersion.business_id.in_(business_ids)))
+    if result.rowcount == len(business_ids):
+        return
+
+    existing = {business_id for (business_id,) in session.query(TenantVersion.business_id).filter(
+        TenantVersion.business_id.in_(business_ids))}
+    for business_id in business_ids:
+        if business_id in existing:
+            continue
+        try:
+            with session.begin_nested():
+                session.execute(db.insert(TenantVersion).values(business_id=business_id, version=1, updated_at=now))
+        except IntegrityError:
+            # Created by a concurrent commit
+            session.execute(bump.where(TenantVersion.business_id == business_id))
+
+def register_versioning(session):
+    if not event.contains(session, 'before_commit', bump_versions):
+        event.listen(session, 'before_commit', bump_versions)
+
+def tenant_version(business_id):
+    """(version, updated_at) for a business, read from tenant_versions only"""
+    row = db.session.query(TenantVersion.version, TenantVersion.updated_at).filter(
+        TenantVersion.business_id == business_id).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+def request_version(business_id):
+    """tenant_version, read at most once per request (conditional reads it first)"""
+    versions = g.setdefault('tenant_versions', {})
+    if business_id not in versions:
+        versions[business_id] = tenant_version(business_id)
+    return versions[business_id]
+
+# Conditional GET
+def conditional(view):
+    """Answer GETs with ETag/Last-Modified from the tenant's version, and 304 when unchanged
+
+    The check runs before the view, so a revalidation reads only the
+    tenant_versions row. The ETag includes the date (on the same local
+    clock as the metrics) because some responses (this month's churn,
+    default date ranges) change with the calendar. HTML pages with pending
+    flash messages are always rendered; JSON API views never show them.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if request.method != 'GET' or (request.blueprint != 'api' and flask_session.get('_flashes')):
+            return view(*args, **kwargs)
+
+        version, updated_at = request_version(current_user.business_id)
+        etag = f"{current_user.business_id}-{version}-{date.today():%Y%m%d}"
+        last_modified = updated_at.replace(microsecond=0) if updated_at else None
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = bool(last_modified and request.if_modified_since and
+                                last_modified <= request.if_modified_since.replace(tzinfo=None))
+        response = make_response(('', 304) if not_modified else view(*args, **kwargs))
+        if response.status_code in (200, 304):
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True  # always revalidate
+        return response
+    return wrapped
@@ -0,0 +1,101 @@
+from flask import Blueprint, render_template, redirect, url_for
+from flask_login import login_required, current_user
+from routes import (register_route, login_route, logout_route, dashboard_route, plans_route, new_plan_route,
+                    edit_plan_route, delete_plan_route, customers_route, new_customer_route, edit_customer_route,
+                    subscriptions_route, new_subscription_route, cancel_subscription_route, run_billing_route)
+from versions import conditional
+from routing import read_only
+
+web = Blueprint('web', __name__)
+
+@web.route('/')
+def index():
+    if current_user.is_authenticated:
+        return redirect(url_for('web.dashboard'))
+    return render_template('index.html')
+
+@web.route('/register', methods=['GET', 'POST'])
+def register():
+    return register_route()
+
+@web.route('/login', methods=['GET', 'POST'])
+def login():
+    return login_route()
+
+@web.route('/logout')
+@login_required
+def logout():
+    return logout_route()
+
+# Dashboard
+@web.route('/dashboard')
+@read_only
+@login_required
+@conditional
+def dashboard():
+    return dashboard_route()
+
+# Plan management
+@web.route('/plans')
+@read_only
+@login_required
+@conditional
+def plans():
+    return plans_route()
+
+@web.route('/plans/new', methods=['GET', 'POST'])
+@login_required
+def new_plan():
+    return new_plan_route()
+
+@web.route('/plans/<int:plan_id>/edit', methods=['GET', 'POST'])
+@login_required
+def edit_plan(plan_id):
+    return edit_plan_route(plan_id)
+
+@web.route('/plans/<int:plan_id>/delete')
+@login_required
+def delete_plan(plan_id):
+    return delete_plan_route(plan_id)
+
+# Customer management
+@web.route('/customers')
+@read_only
+@login_required
+@conditional
+def customers():
+    return customers_route()
+
+@web.route('/customers/new', methods=['GET', 'POST'])
+@login_required
+def new_customer():
+    return new_customer_route()
+
+@web.route('/customers/<int:customer_id>/edit', methods=['GET', 'POST'])
+@login_required
+def edit_customer(customer_id):
+    return edit_customer_route(customer_id)
+
+# Subscription management
+@web.route('/subscriptions')
+@read_only
+@login_required
+@conditional
+def subscriptions():
+    return subscriptions_route()
+
+@web.route('/subscriptions/new', methods=['GET', 'POST'])
+@login_required
+def new_subscription():
+    return new_subscription_route()
+
+@web.route('/subscriptions/<int:subscription_id>/cancel')
+@login_required
+def cancel_subscription(subscription_id):
+    return cancel_subscription_route(subscription_id)
+
+# Billing
+@web.route('/billing/run')
+@login_required
+def run_billing():
+    return run_billing_route()
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Background billing worker for Smart Management Hub
+Polls the billing_jobs table and runs queued billing cycles outside the web workers
+"""
+
+import sys
+from app import create_app
+from models import db
+from jobs import run_worker
+
+def drain_queue(chunk_size):
+    """Process pool entry point: bill queued jobs with this process's own app and engine until none are left"""
+    with create_app().app_context():
+        try:
+            return run_worker(once=True, chunk_size=chunk_size)
+        finally:
+            db.session.remove()
+            db.engine.dispose()  # close this process's connections before the pool exits
+
+if __name__ == "__main__":
+    with create_app().app_context():
+        run_worker(once='--once' in sys.argv)